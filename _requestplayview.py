@@ -1,19 +1,126 @@
+import asyncio, statestore
 from discord import ui, Interaction, Member, Embed, Color, Button, ButtonStyle as BS
+from sessions import SessionView
 
-class RequestToPlayView(ui.View):
-    def __init__(self, player: Member, opponent: Member, game: str = None, timeout: int = 20):
-        super().__init__()
+STORE_GRACE = 5 # Seconds a challenge stays in the store after its view should have timed out, since the timer wheel can be a tick or two late
+
+class ChallengeRegistry:
+    # Keeps track of every challenge that hasn't been answered yet, so one person can't leave loads of them open.
+    # The views are kept in this process, but every open challenge is also written to the state store (see statestore.py)
+    # as "challenger ID:guild ID:opponent ID", so the limit counts the challenges someone has open in every shard process.
+    def __init__(self, limit: int = 3):
+        self.challenges = {} # (guild ID, challenger ID, opponent ID): the challenge's view
+        self.open_challenges = {} # Challenger ID: how many challenges they have open in this process
+        self.deleting = {} # Key: the task taking a closed challenge out of the store
+        self.limit = limit # How many challenges one person can have open at once
+
+    def get(self, guild_id: int, player: Member, opponent: Member):
+        return self.challenges.get((guild_id, player.id, opponent.id))
+
+    def count(self, player: Member):
+        return self.open_challenges.get(player.id, 0)
+
+    @staticmethod
+    def store_key(key: tuple):
+        guild_id, player_id, opponent_id = key
+        return f"{player_id}:{guild_id}:{opponent_id}"
+
+    async def count_everywhere(self, player: Member, ignore: tuple = None):
+        # How many challenges they have open in every process, not counting `ignore`
+        keys = await statestore.store.items("challenges", f"{player.id}:")
+        return len(keys) - (ignore is not None and self.store_key(ignore) in keys)
+
+    def stats(self):
+        return {
+            "open": len(self.challenges), # Challenges (and their views and messages) being held in memory
+            "challengers": len(self.open_challenges) # People with at least one open
+        }
+
+    async def open(self, view):
+        # Add a challenge, replacing the same challenge if it's already open. Returns False (and stops the view) if the challenger already has too many.
+        old = self.challenges.get(view.key)
+
+        if old:
+            await old.replace() # Challenging the same person again just closes the old one and opens this instead
+        elif await self.count_everywhere(view.player, ignore = view.key) >= self.limit:
+            view.stop() # It's never sent, so close its session instead of leaving it to time out
+            return False
+
+        self.challenges[view.key] = view
+        self.open_challenges[view.player.id] = self.count(view.player) + 1
+
+        if view.key in self.deleting: # Let the old one finish being deleted, so it doesn't delete this one
+            await self.deleting[view.key]
+        await self.write(view)
+        return True
+
+    async def write(self, view):
+        # It expires by itself in case this process stops before closing it, a little after the view would have timed out
+        await statestore.store.set("challenges", self.store_key(view.key), b"", ttl = view.session.timeout + STORE_GRACE)
+
+    async def refresh(self, view):
+        # Someone pressed a button, which pushed the view's timeout back, so the store entry has to last longer too
+        if self.challenges.get(view.key) is view:
+            await self.write(view)
+
+    def close(self, view):
+        if self.challenges.get(view.key) is not view: # Already closed, or it got replaced
+            return
+
+        del self.challenges[view.key]
+
+        if self.open_challenges[view.player.id] == 1:
+            del self.open_challenges[view.player.id]
+        else:
+            self.open_challenges[view.player.id] -= 1
+
+        task = asyncio.get_running_loop().create_task(statestore.store.delete("challenges", self.store_key(view.key)))
+        self.deleting[view.key] = task
+
+        def deleted(_):
+            if self.deleting.get(view.key) is task:
+                del self.deleting[view.key]
+        task.add_done_callback(deleted)
+
+challenges = ChallengeRegistry() # Shared by every game
+
+class RequestToPlayView(SessionView):
+    def __init__(self, player: Member, opponent: Member, game: str = None, timeout: int = 20, guild_id: int = None):
+        super().__init__(player, opponent, timeout = timeout)
         self.player = player
         self.opponent = opponent
         self.value = None
-        self.timeout = timeout
         self.game = game
+        self.key = (guild_id, player.id, opponent.id) # How the challenge is found in the registry
+        self.message = None
     
     async def on_callback(self):
         for item in self.children:
             item.disabled = True
 
+    async def interaction_check(self, interaction):
+        await super().interaction_check(interaction) # Pushes the timeout back
+        await challenges.refresh(self)
+        return True
+
+    def stop(self):
+        challenges.close(self) # The challenge has been answered, so it's not open any more
+        super().stop()
+
+    async def replace(self):
+        # Close this challenge because the same one has been sent again
+        self.stop()
+        if self.message:
+            await self.message.edit(
+                content = None,
+                embed = Embed(
+                    description = "~~" + self.message.embeds[0].description + "~~\n\nThis challenge was replaced by a newer one.",
+                    color = Color.dark_embed()
+                ), view = None
+            )
+
     async def on_timeout(self):
+        challenges.close(self)
         await self.on_callback()
         await self.message.edit(
             content = None,
@@ -0,0 +1,145 @@
+# Benchmarks for the win checkers in the games.
+# This imports the game modules but never connects to Discord, so it can be run anywhere discord.py is installed:
+#     python bench_wincheck.py
+#     python bench_wincheck.py --save bench_baseline.json      (record the current numbers)
+#     python bench_wincheck.py --baseline bench_baseline.json  (fail if anything got more than 20% slower)
+
+import argparse, json, random, sys, time, tracemalloc
+from connect4 import Board, BitBoard
+from connect4_check_win import Connect4_CheckWins
+from tictactoe import TicTacToeView
+
+class CheckWins(Connect4_CheckWins):
+    # Connect4_CheckWins is written to be mixed into a class that has a board and valid_moves()
+    def __init__(self, board):
+        self.board = board
+
+    def valid_moves(self):
+        return [column for column in range(7) if self.board[0][column] == 0]
+
+class TicTacToe:
+    # Just the parts of TicTacToeView that check_for_wins uses, because a real view needs an event loop
+    check_for_wins = TicTacToeView.check_for_wins
+
+    def __init__(self, board):
+        cells = [item for line in board for item in line]
+        self.masks = [sum(1 << cell for cell, item in enumerate(cells) if item == piece) for piece in (1, -1)]
+
+def connect4_positions(count, seed):
+    # Play random games and keep the positions after every move, each as a Board and a BitBoard.
+    rng = random.Random(seed)
+    positions = []
+
+    while len(positions) < count:
+        board, bitboard, player = Board(), BitBoard(), 1
+
+        while len(positions) < count:
+            column = rng.choice([c for c in range(1, 8) if not bitboard.is_column_full(c)])
+            board.place_counter(column, player)
+            bitboard.place_counter(column, player)
+
+            # Copy them so later moves in the same game don't change the position
+            copy = BitBoard()
+            copy.bitboards, copy.heights, copy.moves = bitboard.bitboards[:], bitboard.heights[:], bitboard.moves
+            copy.last_move, copy.last_player = bitboard.last_move, bitboard.last_player
+            old = Board()
+            old.board, old.moves, old.last_move = [line[:] for line in board.board], board.moves, board.last_move
+            positions.append((old, copy))
+
+            if bitboard.check_last_move() is not None:
+                break
+            player = 3 - player
+
+    return positions
+
+def tictactoe_positions(count, seed):
+    rng = random.Random(seed)
+    positions = []
+
+    for _ in range(count):
+        cells = [0] * 9
+        for move, cell in enumerate(rng.sample(range(9), rng.randint(0, 9))):
+            cells[cell] = 1 if move % 2 == 0 else -1
+        positions.append([cells[0:3], cells[3:6], cells[6:9]])
+
+    return positions
+
+def measure(calls, repeats):
+    # Returns (nanoseconds per call, bytes allocated per call at the peak)
+    best = None
+    for _ in range(repeats): # Take the fastest run, the others were slowed down by something else
+        start = time.perf_counter_ns()
+        for call in calls:
+            call()
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # Measure memory separately, tracemalloc slows everything down
+    tracemalloc.start()
+    peak = 0
+    for call in calls:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        call()
+        peak += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    return best / len(calls), peak / len(calls)
+
+def benchmarks(count, seed):
+    connect4 = connect4_positions(count, seed)
+    tictactoe = [TicTacToe(board) for board in tictactoe_positions(count, seed)]
+
+    return {
+        "connect4.Board.check": [board.check for board, _ in connect4],
+        "connect4.Board.check_last_move": [board.check_last_move for board, _ in connect4],
+        "connect4.BitBoard.check": [bitboard.check for _, bitboard in connect4],
+        "connect4.BitBoard.check_last_move": [bitboard.check_last_move for _, bitboard in connect4],
+        "Connect4_CheckWins.check_win": [CheckWins(board.board).check_win for board, _ in connect4],
+        "TicTacToeView.check_for_wins": [board.check_for_wins for board in tictactoe]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark the game win checkers.")
+    parser.add_argument("--positions", type = int, default = 2000, help = "How many random positions to check")
+    parser.add_argument("--repeats", type = int, default = 5, help = "How many times to time each checker")
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--save", help = "Write the results to this JSON file")
+    parser.add_argument("--baseline", help = "Compare against results saved with --save")
+    parser.add_argument("--threshold", type = float, default = 1.2, help = "How many times slower than the baseline counts as a regression")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    results = {}
+    regressions = []
+
+    print(f"{'checker':<36}{'ns/op':>12}{'bytes/op':>12}{'baseline':>12}")
+    for name, calls in benchmarks(args.positions, args.seed).items():
+        ns, allocated = measure(calls, args.repeats)
+        results[name] = {"ns": ns, "bytes": allocated}
+
+        previous = baseline.get(name)
+        compared = ""
+        if previous:
+            ratio = ns / previous["ns"]
+            compared = f"{ratio:.2f}x"
+            if ratio > args.threshold:
+                regressions.append(name)
+                compared += " !"
+
+        print(f"{name:<36}{ns:>12.0f}{allocated:>12.0f}{compared:>12}")
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent = 4)
+
+    if regressions:
+        print(f"\n{len(regressions)} checker(s) got more than {args.threshold}x slower: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,58 @@
-import discord, random
+import discord, random, asyncio, functools, struct, persistence, matchmaking, lazy
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime as dt, timedelta as td
 from discord import app_commands, ui, Interaction, ButtonStyle as BS
 from discord.ext import commands
-from _requestplayview import RequestToPlayView
+from _requestplayview import RequestToPlayView, challenges
+from kinarow import KInARow
+from sessions import SessionView
+from edits import edits
+from embeds import EmbedTemplate
+
+connect4_ai = lazy.module("connect4_ai") # Only needed once someone plays the bot
+
+executor = None # The process pool the bot thinks in, so a long search doesn't hold up everything else
+
+def get_executor():
+    global executor
+    if executor is None: # Only start the processes the first time someone plays the bot
+        executor = ProcessPoolExecutor(max_workers = 2)
+    return executor
 
 class ColumnIsFullError:
     pass
 
+SNAPSHOT = struct.Struct("<BQQ") # Whose turn it is and both players' bitboards, for saving games (see persistence.py)
+
+# The embeds the game sends, where only the board and the mentions change (see embeds.py)
+START_EMBED = EmbedTemplate("**Connect 4**", discord.Color.blurple())
+TURN_EMBEDS = (None, EmbedTemplate("🔴 Connect 4", discord.Color.red()), EmbedTemplate("🟡 Connect 4", 0xfdfd96)) # Red for player 1, yellow for player 2
+WIN_EMBED = EmbedTemplate("🏆 Connect 4", discord.Color.green())
+DRAW_EMBED = EmbedTemplate("🤝 Connect 4", discord.Color.light_grey())
+CANCEL_EMBED = EmbedTemplate(color = 0xf8c8dc) # The title has the coin of whoever's turn it was
+
+# The four ways a line can go through a counter: horizontal, vertical and the two diagonals (as row and column steps)
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
 class Board:
     def __init__(self):
         self.board = [[0 for _ in range(7)] for _ in range(6)] # Initialise a board full of zeroes
+        self.moves = 0 # How many counters are on the board
+        self.last_move = None # The (row, column) the last counter landed in
 
     def place_counter(self, column, player):
         # This places a counter on the top layer of the board.
         self.board[0][column - 1] = player
         # This compresses the board to move it down.
         self.compress()
+
+        # The counter that was just placed is now the highest one in its column.
+        for row in range(6):
+            if self.board[row][column - 1] != 0:
+                self.last_move = (row, column - 1)
+                break
+
+        self.moves += 1
         
         # If the column is full, return an error for the button to disable itself.
         # This means no more counters can be placed there again.
@@ -48,6 +85,7 @@ class Board:
             for iterable in board_line: # For every space on the given line
                 if iterable == 0: # If the space is a 0, reset the repeats count because the line is disrupted
                     repeats = 1
+                    item = None # Forget the piece we were watching so the next one starts a new line
                     continue
                 
                 if iterable == item: # If we see the item again, we know it's repeated
@@ -67,7 +105,7 @@ class Board:
     
                         
     def rotate_90(self, matrix): # rotate 90 degrees clockwize
-        return [[matrix[-1-i][x] for i, _ in enumerate(matrix)] for x, _ in enumerate(matrix)]
+        return [[matrix[-1-i][x] for i, _ in enumerate(matrix)] for x, _ in enumerate(matrix[0])]
     
     def horizontalflip(self, matrix): # flips along x axis
         return [line[::-1] for line in matrix]
@@ -117,30 +155,157 @@ class Board:
         return diagonals
     
     def check(self):
-        wins = [
-            self.read_lines(self.board), # Read horizontal lines
-            self.read_lines(self.rotate_90(self.board)), # Read vertical lines
-            self.read_lines(self.rotate_45(self.board)), # Read one set of diagonal lines
-            self.read_lines(self.rotate_45(self.horizontalflip(self.board))) # Read the other set of diagonal lines
-        ]
-
-        if 1 in wins:
-            return 1 # If player 1 gets a Connect 4, return Player 1 won
-        if 2 in wins:
-            return 2 # If player 2 gets a Connect 4, return Player 2 won
-        
-        zeroes = 0
-        for line in self.board:
-            zeroes += line.count(0)
-        
-        if zeroes == 0:
+        # Test every line of 4 on the board at once (see kinarow.py)
+        return KInARow.from_grid(self.board, 4).check() # Player 1 or 2 if they won, False for a draw
+    
+    def check_last_move(self):
+        # Same results as check(), but only looks at the lines going through the counter that was just placed.
+        # Nothing else on the board can have changed, so there's no need to rotate or read the whole board.
+        if self.last_move is None:
+            return
+
+        row, column = self.last_move
+        player = self.board[row][column]
+
+        for dy, dx in DIRECTIONS:
+            count = 1 # The counter we just placed
+
+            # Count the matching counters going one way along the line...
+            y, x = row + dy, column + dx
+            while 0 <= y < 6 and 0 <= x < 7 and self.board[y][x] == player:
+                count += 1
+                y, x = y + dy, x + dx
+
+            # ...and then the other way
+            y, x = row - dy, column - dx
+            while 0 <= y < 6 and 0 <= x < 7 and self.board[y][x] == player:
+                count += 1
+                y, x = y - dy, x - dx
+
+            if count >= 4:
+                return player # Return who got a Connect 4
+
+        if self.moves == 42:
             return False # If the board is full with pieces and no winner, return a draw
 
+class BitBoard:
+    # Same interface as Board, but the state is held as two 64-bit integers (one per player) and a height per column.
+    # Each column takes up 7 bits: 6 for the rows (bottom row first) and 1 empty bit on top so lines can't wrap around.
+    WIDTH = 7
+    HEIGHT = 6
+
+    def __init__(self):
+        self.bitboards = [0, 0] # Player 1's counters, player 2's counters
+        self.heights = [0] * self.WIDTH # How many counters are in each column
+        self.moves = 0 # How many counters are on the board
+        self.last_move = None # The bit of the last counter that was placed
+        self.last_player = None # Who placed it
+
+    def place_counter(self, column, player):
+        column -= 1 # Columns are numbered 1 to 7 on the buttons
+
+        # Put the counter straight on top of the column instead of dropping it down the board.
+        self.last_move = 1 << (column * 7 + self.heights[column])
+        self.last_player = player
+        self.bitboards[player - 1] |= self.last_move
+        self.heights[column] += 1
+        self.moves += 1
+
+        # If the column is full, return an error for the button to disable itself.
+        if self.heights[column] == self.HEIGHT:
+            return ColumnIsFullError
+
+    def is_column_full(self, column):
+        return self.heights[column - 1] == self.HEIGHT
+
+    def is_full(self):
+        return self.moves == self.WIDTH * self.HEIGHT
+
+    @property
+    def board(self):
+        # Build the same 6x7 grid that Board uses, with row 0 at the top.
+        p1, p2 = self.bitboards
+        grid = []
+
+        for row in range(self.HEIGHT - 1, -1, -1):
+            line = []
+
+            for column in range(self.WIDTH):
+                bit = 1 << (column * 7 + row)
+                line.append(1 if p1 & bit else 2 if p2 & bit else 0)
+
+            grid.append(line)
+
+        return grid
+
+    def check(self):
+        for player, bitboard in enumerate(self.bitboards, start = 1):
+            # Shifting by 1 checks vertical lines, 7 horizontal lines, and 6 and 8 the two sets of diagonals
+            for shift in (1, 7, 6, 8):
+                pairs = bitboard & (bitboard >> shift)
+
+                if pairs & (pairs >> 2 * shift):
+                    return player # Return who got a Connect 4
+
+        if self.is_full():
+            return False # If the board is full with pieces and no winner, return a draw
+
+    def check_last_move(self):
+        # Same results as check(), but only follows the four lines going through the counter that was just placed.
+        if self.last_move is None:
+            return
+
+        bitboard = self.bitboards[self.last_player - 1]
+
+        for shift in (1, 7, 6, 8):
+            count = 1 # The counter we just placed
+
+            # The empty bit on top of each column stops these from running into the next column
+            probe = self.last_move >> shift
+            while bitboard & probe:
+                count += 1
+                probe >>= shift
+
+            probe = self.last_move << shift
+            while bitboard & probe:
+                count += 1
+                probe <<= shift
+
+            if count >= 4:
+                return self.last_player # Return who got a Connect 4
+
+        if self.is_full():
+            return False # If the board is full with pieces and no winner, return a draw
+
+CELLS = ('⬛', '🔴', '🟡') # What an empty space, a player 1 counter and a player 2 counter look like
+POWERS = tuple(3 ** (6 - column) for column in range(7)) # What a counter in each column adds to its row's number
+# Every row that can be on the board, looked up by reading the row as a base 3 number (e.g. ⬛🔴⬛⬛⬛⬛🟡 is 0100002)
+ROWS = tuple("".join(CELLS[code // power % 3] for power in POWERS) for code in range(3 ** 7))
+HEADER = ":one::two::three::four::five::six::seven:\n" # Headers (to show the columns that relate to the buttons)
+
+class BoardRenderer:
+    # Keeps the board written out as emojis, so each move only changes the one row the counter landed in.
+    def __init__(self):
+        self.codes = [0] * 6 # Each row as a base 3 number, with row 0 at the top
+        self.rows = [ROWS[0]] * 6
+        self.text = None # The whole board, until something changes
+
+    def place(self, row, column, player):
+        self.codes[row] += player * POWERS[column - 1]
+        self.rows[row] = ROWS[self.codes[row]]
+        self.text = None
+
+    def render(self):
+        if self.text is None:
+            self.text = HEADER + "\n".join(self.rows)
+        return self.text
+
 class ColumnsButton(ui.Button):
     def __init__(self, column):
         super().__init__(
             label = column,
             style = BS.blurple,
+            custom_id = f"connect4:{column}", # Fixed so the game can be picked back up after a restart
             row = column // 5
         )
         self.column = column # Get a number from 1 to 7
@@ -149,22 +314,30 @@ class ColumnsButton(ui.Button):
         if interaction.user == self.view.players[self.view.player]:
             A = self.view.play_move(self.column)
             await self.view.play(A, interaction, self)
+
+            # If the game is still going and it's the bot's turn, let it play
+            if A not in [0, 1, 2] and self.view.players[self.view.player] == self.view.bot_player:
+                await self.view.bot_move(interaction)
+
+            await self.view.save() # Save the move in case the bot restarts
         else:
             await interaction.response.send_message(content = "it's not your turn.", ephemeral = True)
 
-class Columns(ui.View):
-    def __init__(self, *players, bet: int = 0):
-        super().__init__()
-        self.board = Board()
+class Columns(SessionView):
+    def __init__(self, *players, bet: int = 0, bot_player: discord.Member = None, thinking_time: int = 1000):
+        super().__init__(*players, timeout = 30)
+        self.board = BitBoard()
+        self.renderer = BoardRenderer()
 
         cancel_button = self.children[0]
         self.remove_item(cancel_button)
 
         for i in range(7):
-            self.add_item(ColumnsButton(i + 1, row = i % 5))
+            self.add_item(ColumnsButton(i + 1))
         
         self.add_item(cancel_button)
 
+        players = list(players)
         random.shuffle(players)
         self.player = random.choice([1, 2])
         self.coin = ['🔴', '🟡'][self.player - 1]
@@ -174,22 +347,108 @@ class Columns(ui.View):
         self.timeout = 30
         self.cancelled = True
         self.cancel_user = self.players[self.player]
+        self.drawn = False
+
+        self.bot_player = bot_player # The member the computer plays as, if there is one
+        self.thinking_time = thinking_time # How long the bot can think for each move, in milliseconds
+        self.message = None # The game's message, once it's been sent
+        self.evicted = False # If the game was dropped from memory (see persistence.py) rather than finished
+
+    def snapshot(self):
+        return SNAPSHOT.pack(self.player, *self.board.bitboards)
+
+    async def save(self):
+        await persistence.save(self, self.message, persistence.CONNECT4, [self.players[1], self.players[2]], self.bot_player, self.snapshot())
+
+    @classmethod
+    async def from_snapshot(cls, players, bot_player, state, message):
+        # Rebuild a saved game (see persistence.py) and carry on waiting for it to finish
+        view = cls(*players, bot_player = bot_player)
+        view.players = {1: players[0], 2: players[1]}
+        view.player, *view.board.bitboards = SNAPSHOT.unpack(state)
+        view.coin = ['🔴', '🟡'][view.player - 1]
+        view.message = message
+
+        counters = view.board.bitboards[0] | view.board.bitboards[1]
+        for column in range(7):
+            view.board.heights[column] = (counters >> column * 7 & 0x3f).bit_count()
+        view.board.moves = counters.bit_count()
+
+        # Draw the counters back on the board and disable the full columns
+        for row, line in enumerate(view.board.board):
+            for column, player in enumerate(line):
+                if player:
+                    view.renderer.place(row, column + 1, player)
+
+        for item in view.children:
+            if isinstance(item, ColumnsButton) and view.board.is_column_full(item.column):
+                item.disabled = True
+
+        asyncio.get_running_loop().create_task(view.finish())
+        return view
+
+    @property
+    def winner(self):
+        # Who won once the game's over, or None if it was a draw
+        if self.drawn:
+            return None
+        if not self.cancelled:
+            return self.players[self.player]
+        return [p for p in self.players.values() if p != self.cancel_user][0] # Whoever didn't run away
+
+    async def finish(self):
+        await self.wait() # Play the game
+
+        if self.evicted: # The game isn't over, it's just been saved for later
+            return
+
+        await persistence.forget(self.message.id)
+
+        if self.drawn: # Announce the draw
+            await edits.edit(
+                self.message,
+                content = None,
+                embed = DRAW_EMBED.render(self.retrieve_board() + "\n\nThe board is full, so it's a draw!"),
+                view = None
+            )
+
+        # Announce who the winner is
+        elif not self.cancelled: # If the game HASN'T been cancelled
+            await edits.edit(
+                self.message,
+                content = None,
+                embed = WIN_EMBED.render(self.retrieve_board() + f"\n\nLooks like {self.players[self.player].mention} won the game! Well done!"),
+                view = None
+            )
+        else: # If the game HAS been cancelled
+            # Announce the person who ran away and say who won
+            await edits.edit(
+                self.message,
+                content = self.players[self.player].mention, view = None, embed = CANCEL_EMBED.render(
+                    self.retrieve_board() + f"\n\n💸 {self.cancel_user.mention} ran from the match, which means {self.winner.mention} won the match!",
+                    title = f"{self.coin} Connect 4"
+                )
+            )
 
     async def on_callback(self):
         for item in self.children:
             item.disabled = True
 
-    async def on_timeout(self):
+    def timed_out(self):
+        # Whoever's turn it is ran away. Set before view.wait() returns, so finish() says who it really was.
         self.cancelled = True
         self.cancel_user = self.players[self.player]
+
+    async def on_timeout(self):
+        self.timed_out()
         await self.on_callback()
         self.stop()
 
     def play_move(self, column):
-        if self.board.place_counter(column, self.player) is ColumnIsFullError: # Place the counter and check if it returns that column error
-            return -1
+        column_full = self.board.place_counter(column, self.player) is ColumnIsFullError # Place the counter and check if it returns that column error
+        self.renderer.place(BitBoard.HEIGHT - self.board.heights[column - 1], column, self.player) # Redraw the row it landed in
         
-        winner = self.board.check() # Check if anybody has won yet
+        winner = self.board.check_last_move() # Check if the counter that was just placed won the game
 
         if winner:
             return winner # Return who won (either Player 1 or Player 2)
@@ -198,21 +457,38 @@ class Columns(ui.View):
         
         self.player = 2 if self.player == 1 else 1
 
+        if column_full:
+            return -1
+
+    async def think(self):
+        # Ask the bot which column to play in. The search runs in another process so the bot can keep responding to everyone else.
+        return await asyncio.get_running_loop().run_in_executor(
+            get_executor(),
+            connect4_ai.best_move,
+            tuple(self.board.bitboards), tuple(self.board.heights), self.board.moves, self.player, self.thinking_time
+        )
+
+    async def bot_move(self, interaction):
+        column = await self.think()
+        button = [item for item in self.children if isinstance(item, ColumnsButton) and item.column == column][0]
+        await self.play(self.play_move(column), interaction, button)
+
     def retrieve_board(self): # Write out the board
-        board_str = f":one::two::three::four::five::six::seven:\n" # Headers (to show the columns that relate to the buttons)
-        board_str += "\n".join(["".join([str(i) for i in self.board.board[x]]) for x, _ in enumerate(self.board.board)]) # The board itself
-        
-        # Relace 0s with black squares, 1s with red counters and 2s with yellow counters
-        board_str = board_str.replace('0', '⬛').replace('1', '🔴').replace('2', '🟡')
-        return board_str
+        return self.renderer.render()
     
+    async def edit(self, interaction, **kwargs):
+        # Moves made close together are sent as one edit (see edits.py).
+        # The bot's move comes after the player's move has already been responded to, so that one just edits the message.
+        await edits.edit(interaction.message, interaction, **kwargs)
+
     async def play(self, A, interaction, button):
         if A == -1: # If the column is full
-            button.disabled = True # Disable the button
-            await interaction.response.edit_message(view = self) # Update the view
+            button.disabled = True # Disable the button, then carry on to the next turn
         
-        elif A == 0: # If it's a draw
-            await interaction.response.edit_message(embed = self.draw_embed, view = None) # Update with the draw_embed
+        if A == 0: # If it's a draw
+            self.cancelled = False # Show nobody ran away
+            self.drawn = True # finish() announces it
+            await self.on_callback() # Disable all buttons
             self.stop() # Stop listening for input
         
         elif A in [1, 2]:
@@ -221,24 +497,16 @@ class Columns(ui.View):
             self.stop() # Stop listening for input
         
         else:
-            if self.player == 1: # If it's player 1, use the red counter
-                self.coin = "🔴"
-                embedcolour = discord.Color.red() # Change the embed to red
-            else:
-                self.coin = "🟡"
-                embedcolour = 0xfdfd96 # Change the embed to yellow
+            self.coin = "🔴" if self.player == 1 else "🟡" # Red counter for player 1, yellow for player 2
 
-            await interaction.response.edit_message(
+            await self.edit(
+                    interaction,
                     content = self.players[self.player].mention, # Ping the person playing
                     view = self, # Update the view
-                    embed = discord.Embed(
-                        title = f"{self.coin} Connect 4", # Show who's turn it is
-                        description = self.retrieve_board(), # Get the formatted board state
-                        color = embedcolour # Change the embed colour
-                    )
+                    embed = TURN_EMBEDS[self.player].render(self.retrieve_board()) # Show whose turn it is and the board
                 )
     
-    @ui.button(label = "❌", style = BS.red, row = 1)
+    @ui.button(label = "❌", style = BS.red, row = 1, custom_id = "connect4:cancel")
     async def cancel(self, interaction: Interaction, button: ui.Button):
         if not interaction.user in self.players.values():
             await interaction.response.send_message(content = "you're not involved, lil bro", ephemeral = True)
@@ -256,6 +524,18 @@ class Connect4(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
+    async def cog_load(self):
+        await persistence.setup(self.bot) # Pick games back up after a restart
+
+    async def cog_unload(self):
+        if executor: # Stop the bot's processes if anyone played it
+            executor.shutdown(wait = False, cancel_futures = True)
+
+        # Drop the games from memory. They're saved, so they'll come back when someone presses a button.
+        for message_id, view in list(persistence.live.items()):
+            if isinstance(view, Columns):
+                persistence.evict(message_id)
+
     @app_commands.command(name = "connect4", description = "Play Connect 4 with another user. Have fun!")
     @commands.cooldown(1, 30, commands.BucketType.user) # Set a 30s cooldown after playing
     async def connect4(self, interaction: Interaction, opponent: discord.Member = None):
@@ -269,11 +549,34 @@ class Connect4(commands.Cog):
             )
             return
 
-        if opponent == self.bot: # If the opponent is this bot
-            await interaction.response.send_message("You can't play with me at the moment. I'm busy. :x:")
+        if opponent == self.bot.user: # If the opponent is this bot, there's no need to ask
+            game_view = Columns(interaction.user, opponent, bot_player = opponent) # Setup the game view
+
+            if game_view.players[game_view.player] == opponent: # If the bot goes first, play its move before showing the board
+                await interaction.response.defer() # Thinking (and waiting for a free process) can take longer than Discord waits for a response
+                game_view.play_move(await game_view.think())
+
+            board = dict(content = game_view.players[game_view.player].mention, embed = START_EMBED.render(game_view.retrieve_board()), view = game_view)
+            if interaction.response.is_done():
+                game_view.message = await interaction.edit_original_response(**board)
+            else:
+                await interaction.response.send_message(**board)
+                game_view.message = await interaction.original_response()
+            await game_view.save()
+            await game_view.finish()
             return
             
-        view = RequestToPlayView(interaction.user, opponent, game = "Connect 4")
+        view = RequestToPlayView(interaction.user, opponent, game = "Connect 4", guild_id = interaction.guild_id)
+
+        if not await challenges.open(view): # If they have too many challenges open already
+            await interaction.response.send_message(
+                ephemeral = True,
+                embed = discord.Embed(
+                    description = f"You already have {challenges.limit} challenges open! Wait for someone to answer one first.",
+                    color = discord.Color.red()
+                )
+            )
+            return
 
         requestToPlay = discord.Embed(
             title = ":mag: Someone wants to play a game of Connect 4!",
@@ -296,45 +599,7 @@ class Connect4(commands.Cog):
         
         await view.message.delete() # Delete the request to play message
 
-        game_view = Columns(interaction.user, opponent) # Setup the game view
-        
-        # Setup the game message
-        await interaction.followup.send(
-            content = game_view.players[game_view.player].mention,
-            embed = discord.Embed(
-                title = "**Connect 4**",
-                description = game_view.retrieve_board(),
-                color = discord.Color.blurple()
-            ), view = game_view
-        )
-
-        board_message = await interaction.original_response()
-
-        await game_view.wait() # Play the game
-
-        # Announce who the winner is
-        if not game_view.cancelled: # If the game HASN'T been cancelled
-            await board_message.edit(
-                content = None,
-                embed = discord.Embed(
-                    title = "🏆 Connect 4",
-                    description = game_view.retrieve_board() + f"\n\nLooks like {game_view.players[game_view.player].mention} won the game! Well done!",
-                    color = discord.Color.green()
-                ), view = None
-            )
-        else: # If the game HAS been cancelled
-            players = list(game_view.values())
-            # This basically checks for the user that's NOT the winner and then finds it in a list of the two players
-            winner = [p for p in players if p != game_view.cancel_user][0]
-
-            # Announce the person who ran away and say who won
-            await board_message.edit(
-                content = game_view.players[game_view.player].mention, view = None, embed = discord.Embed(
-                    title = f"{game_view.coin} Connect 4",
-                    description = game_view.retrieve_board() + f"\n\n💸 {game_view.cancel_user.mention} ran from the match, which means {winner.mention} won the match!",
-                    color = 0xf8c8dc
-                )
-            )
+        await start_game(functools.partial(interaction.followup.send, wait = True), interaction.user, opponent)
     
     @connect4.error
     async def connect4_errors(self, ctx, error):
@@ -349,5 +614,21 @@ class Connect4(commands.Cog):
         else:
             raise error
 
+async def start_game(send, *players: discord.Member):
+    # Send a game between two people with `send` (like a followup or a thread's send), and play it
+    game_view = Columns(*players) # Setup the game view
+
+    # Setup the game message
+    game_view.message = await send(
+        content = game_view.players[game_view.player].mention,
+        embed = START_EMBED.render(game_view.retrieve_board()), view = game_view
+    )
+    await game_view.save()
+    await game_view.finish()
+    return game_view
+
 async def setup(bot):
   await bot.add_cog(Connect4(bot))
+
+persistence.restorers[persistence.CONNECT4] = Columns.from_snapshot
+matchmaking.games["connect4"] = start_game
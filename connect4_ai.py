@@ -0,0 +1,196 @@
+# A computer player for Connect 4.
+# It uses the same layout as connect4.BitBoard: 7 bits per column (6 rows, bottom first, and 1 empty bit on top).
+# The search is negamax with alpha-beta pruning, a transposition table and iterative deepening,
+# so it always has a move ready when the time runs out.
+# Positions it has searched deeply are kept in an opening book on disk (see connect4_book.py) so they don't need searching again.
+# This file doesn't import discord so it can be run in a separate process.
+
+import os, time
+from connect4_book import Book, BookTable
+
+WIDTH = 7
+HEIGHT = 6
+WIN = 1000 # Score for winning right now. Wins further away score a bit less.
+
+BOTTOM = sum(1 << (column * 7) for column in range(WIDTH)) # The bottom cell of every column
+BOARD_MASK = BOTTOM * ((1 << HEIGHT) - 1) # Every playable cell
+COLUMN_ORDER = (3, 2, 4, 1, 5, 0, 6) # Try the middle columns first, they're usually better
+COLUMN_MASKS = tuple(((1 << HEIGHT) - 1) << (column * 7) for column in range(WIDTH))
+
+MAX_TABLE_SIZE = 1_000_000 # Clear the transposition table once it gets this big
+BOOK_PATH = os.environ.get("CONNECT4_BOOK", "connect4_book.bin")
+BOOK_DEPTH = 8 # Play a move from the book without searching if it was searched at least this deep
+
+EXACT, LOWER, UPPER = 0, 1, 2 # What kind of score is stored in the transposition table
+
+class SearchTimeout(Exception):
+    pass
+
+def winning_cells(position, mask):
+    # Find every empty cell that would finish a line of 4 for the player who owns `position`.
+    # Vertical
+    cells = (position << 1) & (position << 2) & (position << 3)
+
+    for shift in (7, 6, 8): # Horizontal and the two diagonals
+        pairs = (position << shift) & (position << 2 * shift)
+        cells |= pairs & (position << 3 * shift) # The cell on the right of 3 counters
+        cells |= pairs & (position >> shift) # The cell on the right of 2, with 1 more on the left
+        pairs = (position >> shift) & (position >> 2 * shift)
+        cells |= pairs & (position << shift) # The cell on the left of 2, with 1 more on the right
+        cells |= pairs & (position >> 3 * shift) # The cell on the left of 3 counters
+
+    return cells & (BOARD_MASK ^ mask)
+
+def evaluate(position, mask):
+    # Score a position that's still going by counting the cells each player could win in.
+    opponent = position ^ mask
+    score = winning_cells(position, mask).bit_count() - winning_cells(opponent, mask).bit_count()
+
+    # Counters in the middle column are part of more lines than anywhere else
+    score *= 4
+    score += (position & COLUMN_MASKS[3]).bit_count() - (opponent & COLUMN_MASKS[3]).bit_count()
+    return score
+
+class Search:
+    def __init__(self, table: dict, deadline: float):
+        self.table = table
+        self.deadline = deadline
+        self.nodes = 0
+
+    def ordered_moves(self, position, mask, possible, best):
+        # Moves that set up the most wins go first, then the transposition table's move, then the middle columns.
+        moves = []
+
+        for column in COLUMN_ORDER:
+            move = possible & COLUMN_MASKS[column]
+            if move:
+                threats = winning_cells(position | move, mask | move).bit_count()
+                moves.append((column != best, -threats, len(moves), column, move))
+
+        moves.sort()
+        return moves
+
+    def negamax(self, position, mask, moves, depth, alpha, beta):
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+
+        possible = (mask + BOTTOM) & BOARD_MASK
+
+        # Win straight away if we can
+        if winning_cells(position, mask) & possible:
+            return WIN - moves - 1
+
+        if moves >= WIDTH * HEIGHT - 2: # One move each left and nobody can win with theirs
+            return 0
+
+        # If the opponent could win next move, we have to block them
+        threats = winning_cells(position ^ mask, mask)
+        forced = possible & threats
+        if forced:
+            if forced & (forced - 1): # Two places to block, so we can't stop both
+                return -(WIN - moves - 2)
+            possible = forced
+
+        possible &= ~(threats >> 1) # Don't play right underneath a cell the opponent wins in
+        if not possible:
+            return -(WIN - moves - 2)
+
+        if depth == 0:
+            return evaluate(position, mask)
+
+        key = position + mask # Unique for every position
+        entry = self.table.get(key)
+        best_column = None
+        original_alpha = alpha
+
+        if entry:
+            entry_depth, flag, score, best_column = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return score
+                if flag == LOWER:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+
+        best_score = -WIN * 2
+        for *_, column, move in self.ordered_moves(position, mask, possible, best_column):
+            # Play the move and look at it from the opponent's side
+            score = -self.negamax(position ^ mask, mask | move, moves + 1, depth - 1, -beta, -alpha)
+
+            if score > best_score:
+                best_score = score
+                best_column = column
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if len(self.table) >= MAX_TABLE_SIZE:
+            self.table.clear()
+
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+
+        self.table[key] = (depth, flag, best_score, best_column)
+        return best_score
+
+    def root(self, position, mask, moves, depth):
+        # Same as negamax() but keeps track of which column was best.
+        possible = (mask + BOTTOM) & BOARD_MASK
+        best_score, best_column = -WIN * 2, None
+        alpha, beta = -WIN * 2, WIN * 2
+
+        entry = self.table.get(position + mask)
+        for *_, column, move in self.ordered_moves(position, mask, possible, entry and entry[3]):
+            if winning_cells(position, mask) & move:
+                return WIN - moves - 1, column
+
+            score = -self.negamax(position ^ mask, mask | move, moves + 1, depth - 1, -beta, -alpha)
+
+            if score > best_score:
+                best_score, best_column = score, column
+            alpha = max(alpha, score)
+
+        return best_score, best_column
+
+table = None # Kept between searches in the same process so the positions don't need to be searched again
+
+def get_table():
+    global table
+    if table is None: # Only open the book once a process actually has to search
+        table = BookTable(Book(BOOK_PATH))
+    return table
+
+def best_move(bitboards, heights, moves, player, budget_ms = 1000, use_book = True):
+    # Work out which column (1 to 7) the player should play in, taking at most about budget_ms milliseconds.
+    # Takes the state of a connect4.BitBoard as plain values so it can be sent to another process.
+    position = bitboards[player - 1]
+    mask = bitboards[0] | bitboards[1]
+
+    entry = get_table().get(position + mask)
+    if use_book and entry and entry[1] == EXACT and (entry[0] >= BOOK_DEPTH or abs(entry[2]) > WIN // 2):
+        return entry[3] + 1 # We've already solved this position
+
+    search = Search(table, time.perf_counter() + budget_ms / 1000)
+    best_column = next(column for column in COLUMN_ORDER if heights[column] < HEIGHT) # Something to fall back on
+
+    # Search one move further every time until we run out of time or find a result that won't change.
+    for depth in range(1, WIDTH * HEIGHT - moves + 1):
+        try:
+            score, column = search.root(position, mask, moves, depth)
+        except SearchTimeout:
+            break
+
+        best_column = column
+        table[position + mask] = (depth, EXACT, score, column) # Remember how far we got for next time
+        if abs(score) > WIN // 2: # Somebody can force a win, there's no need to look further
+            break
+
+    return best_column + 1
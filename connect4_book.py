@@ -0,0 +1,199 @@
+# An opening book and transposition table for connect4_ai that's kept on disk.
+# The file is a fixed size hash table of 16 byte records which is memory-mapped, so every process
+# searching positions reads the same pages instead of loading its own copy.
+# Positions are stored under whichever of the position and its mirror image has the lower key,
+# so a position that's just been flipped left to right only has to be solved once.
+#
+# Build the book for the first few moves with:
+#     python connect4_book.py connect4_book.bin --plies 2 --budget 5000
+
+import mmap, os, struct
+from collections import OrderedDict
+
+MAGIC = b"C4BK"
+HEADER = struct.Struct("<4sHxxQ") # Magic, version, number of slots
+RECORD = struct.Struct("<QBBhBxH") # Key, depth, flag, score, column, checksum
+VERSION = 1
+PROBES = 8 # How many slots to look at before giving up on a key
+
+def mirror(key):
+    # Flip a position left to right. Each column's 7 bits don't carry into the next, so the columns can just be swapped around.
+    flipped = 0
+    for _ in range(7):
+        flipped = (flipped << 7) | (key & 0x7f)
+        key >>= 7
+    return flipped
+
+def canonical(key):
+    # Returns the key to store the position under and whether it had to be mirrored to get it
+    flipped = mirror(key)
+    return (flipped, True) if flipped < key else (key, False)
+
+def checksum(key, depth, flag, score, column):
+    # Catches records that were half written by another process when we read them
+    return (key ^ (key >> 16) ^ (key >> 32) ^ (key >> 48) ^ (depth << 8) ^ flag ^ (score & 0xffff) ^ (column << 12)) & 0xffff
+
+class Book:
+    def __init__(self, path: str, slots: int = 1 << 20):
+        self.path = path
+        self.slots = slots
+        self.map = None # Opened the first time it's used
+
+    def open(self):
+        if not os.path.exists(self.path):
+            self.create()
+
+        with open(self.path, "r+b") as file:
+            self.map = mmap.mmap(file.fileno(), 0)
+
+        magic, version, self.slots = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.path} isn't a Connect 4 book")
+
+    def create(self):
+        # Make the empty book somewhere else and link it into place, so another process opening the book at the same time
+        # never sees a half made file, and one that's already been made (and maybe mapped) is never truncated
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, "wb") as file:
+                file.write(HEADER.pack(MAGIC, VERSION, self.slots))
+                file.truncate(HEADER.size + self.slots * RECORD.size)
+            os.link(temporary, self.path)
+        except FileExistsError: # Another process made it first
+            pass
+        finally:
+            os.remove(temporary)
+
+    def offsets(self, key):
+        slot = (key * 0x9e3779b97f4a7c15 >> 20) % self.slots # Spread the keys out over the table
+        for i in range(PROBES):
+            yield HEADER.size + (slot + i) % self.slots * RECORD.size
+
+    def get(self, key):
+        # Look up a position's (depth, flag, score, column), or None if it isn't in the book.
+        if self.map is None:
+            self.open()
+
+        stored_key, mirrored = canonical(key)
+        stored_key += 1 # So an empty slot (key 0) never matches
+
+        for offset in self.offsets(stored_key):
+            record_key, depth, flag, score, column, check = RECORD.unpack_from(self.map, offset)
+
+            if record_key == 0:
+                return
+            if record_key == stored_key and check == checksum(record_key, depth, flag, score, column):
+                return (depth, flag, score, 6 - column if mirrored else column)
+
+    def put(self, key, entry):
+        if self.map is None:
+            self.open()
+
+        depth, flag, score, column = entry
+        if column is None:
+            return
+
+        stored_key, mirrored = canonical(key)
+        stored_key += 1
+        if mirrored:
+            column = 6 - column
+
+        # Use the slot that already has this position, or an empty one, or else the one with the least searched position.
+        replace, replace_depth = None, None
+        for offset in self.offsets(stored_key):
+            record_key, record_depth = RECORD.unpack_from(self.map, offset)[:2]
+
+            if record_key in (0, stored_key):
+                if record_key == stored_key and record_depth > depth:
+                    return # We already know more about this position
+                replace = offset
+                break
+
+            if replace is None or record_depth < replace_depth:
+                replace, replace_depth = offset, record_depth
+
+        if replace_depth is not None and replace_depth > depth:
+            return
+
+        RECORD.pack_into(self.map, replace, stored_key, depth, flag, score, column, checksum(stored_key, depth, flag, score, column))
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+class BookTable:
+    # Drop-in replacement for the transposition table dict in connect4_ai.
+    # Recent positions are kept in memory up to `size`, and the deepest ones are also written straight to the book,
+    # so every other process searching can use them right away and nothing is lost when a process stops.
+    def __init__(self, book: Book, size: int = 200_000, persist_depth: int = 6):
+        self.book = book
+        self.size = size
+        self.persist_depth = persist_depth # Shallower searches are cheaper to redo than to store
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+
+        if entry is None:
+            entry = self.book.get(key)
+            if entry is None:
+                return
+            self.entries[key] = entry
+        else:
+            self.entries.move_to_end(key)
+
+        if len(self.entries) > self.size:
+            self.evict()
+
+        return entry
+
+    def __setitem__(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if entry[0] >= self.persist_depth:
+            self.book.put(key, entry)
+
+        if len(self.entries) > self.size:
+            self.evict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def evict(self):
+        self.entries.popitem(last = False) # The position that was used longest ago, which is already in the book if it's worth keeping
+
+    def clear(self):
+        # connect4_ai clears its table when it gets too big, but this one already evicts as it goes
+        pass
+
+if __name__ == "__main__":
+    import argparse, itertools, connect4_ai
+
+    parser = argparse.ArgumentParser(description = "Solve the first few Connect 4 moves into a book.")
+    parser.add_argument("path")
+    parser.add_argument("--plies", type = int, default = 2, help = "How many moves into the game to solve")
+    parser.add_argument("--budget", type = int, default = 5000, help = "Milliseconds to search each position for")
+    args = parser.parse_args()
+
+    table = BookTable(Book(args.path))
+    connect4_ai.table = table
+    seen = set()
+
+    for plies in range(args.plies + 1):
+        for moves in itertools.product(range(7), repeat = plies):
+            bitboards, heights = [0, 0], [0] * 7
+
+            for ply, column in enumerate(moves):
+                bitboards[ply % 2] |= 1 << (column * 7 + heights[column])
+                heights[column] += 1
+
+            key = canonical(bitboards[plies % 2] + (bitboards[0] | bitboards[1]))[0]
+            if key in seen: # The same position can come from different move orders, or be a mirror image
+                continue
+            seen.add(key)
+
+            column = connect4_ai.best_move(bitboards, heights, plies, plies % 2 + 1, args.budget, use_book = False)
+            print(f"{' '.join(str(c + 1) for c in moves) or '(start)'}: play {column}")
+
+    table.book.close()
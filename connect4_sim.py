@@ -0,0 +1,134 @@
+# Plays lots of Connect 4 games at once, for testing changes to the engine and tuning the bot offline.
+# Every game in a batch is held in NumPy arrays with the same layout as connect4.BitBoard,
+# so each move and win check is done for the whole batch in one go. Needs numpy installed.
+#     python connect4_sim.py --games 1000000 --policy greedy --verify 500
+
+import argparse, time
+import numpy as np
+
+WIDTH = 7
+HEIGHT = 6
+SHIFTS = (1, 7, 6, 8) # Vertical, horizontal and the two diagonals, like BitBoard.check
+
+def has_won(bitboards):
+    # Which of the bitboards have a line of 4 in them
+    won = np.zeros(bitboards.shape, dtype = bool)
+
+    for shift in SHIFTS:
+        pairs = bitboards & (bitboards >> np.uint64(shift))
+        won |= (pairs & (pairs >> np.uint64(2 * shift))) != 0
+
+    return won
+
+def cell_bits(heights):
+    # The bit each column's next counter would go in, for every game (shape: games x columns)
+    columns = np.arange(WIDTH, dtype = np.uint64) * np.uint64(7)
+    return np.left_shift(np.uint64(1), columns + heights.astype(np.uint64))
+
+def winning_columns(position, heights, legal):
+    # Which columns would win the game straight away for the player who owns `position`
+    placed = position[:, None] | cell_bits(heights)
+    return has_won(placed) & legal
+
+class Simulator:
+    def __init__(self, games: int, policy: str = "random", seed: int = None):
+        self.games = games
+        self.policy = policy
+        self.rng = np.random.default_rng(seed)
+
+        self.bitboards = np.zeros((games, 2), dtype = np.uint64) # Player 1 and player 2's counters
+        self.heights = np.zeros((games, WIDTH), dtype = np.int8)
+        self.history = np.zeros((games, WIDTH * HEIGHT), dtype = np.int8) # The column of every move (1 to 7), for checking afterwards
+        self.results = np.full(games, -1, dtype = np.int8) # -1 still playing, 0 draw, 1 or 2 for who won
+
+    def choose(self, active, player):
+        legal = self.heights[active] < HEIGHT
+
+        # Pick a random legal column for each game
+        scores = self.rng.random(legal.shape)
+        scores[~legal] = -1
+
+        if self.policy == "greedy":
+            # Block the opponent's win if there is one, and take our own win over anything else
+            scores[winning_columns(self.bitboards[active, 2 - player], self.heights[active], legal)] += 2
+            scores[winning_columns(self.bitboards[active, player - 1], self.heights[active], legal)] += 4
+
+        return scores.argmax(axis = 1)
+
+    def run(self):
+        for move in range(WIDTH * HEIGHT):
+            active = np.flatnonzero(self.results == -1)
+            if not len(active):
+                break
+
+            player = move % 2 + 1 # Player 1 always goes first
+            columns = self.choose(active, player)
+
+            # Place every game's counter
+            bits = np.left_shift(np.uint64(1), columns.astype(np.uint64) * np.uint64(7) + self.heights[active, columns].astype(np.uint64))
+            self.bitboards[active, player - 1] |= bits
+            self.heights[active, columns] += 1
+            self.history[active, move] = columns + 1
+
+            won = has_won(self.bitboards[active, player - 1])
+            self.results[active[won]] = player
+
+        self.results[self.results == -1] = 0 # Everything left filled the board without anyone winning
+        return self.results
+
+def verify(simulator: Simulator, count: int):
+    # Replay some of the games through connect4.Board and check it agrees about who won and when.
+    from connect4 import Board
+
+    mismatches = 0
+    for game in range(min(count, simulator.games)):
+        board, result = Board(), None
+
+        for move, column in enumerate(simulator.history[game]):
+            if column == 0:
+                break
+            board.place_counter(int(column), move % 2 + 1)
+            result = board.check()
+
+            if result is not None and move + 1 < len(simulator.history[game]) and simulator.history[game][move + 1] != 0:
+                result = "early" # Board thinks the game ended before the simulator did
+                break
+
+        if {1: 1, 2: 2, False: 0}.get(result, -1) != simulator.results[game]:
+            mismatches += 1
+
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description = "Play lots of Connect 4 games at once.")
+    parser.add_argument("--games", type = int, default = 100_000)
+    parser.add_argument("--batch", type = int, default = 50_000, help = "How many games to hold at once")
+    parser.add_argument("--policy", choices = ["random", "greedy"], default = "random")
+    parser.add_argument("--seed", type = int, default = None)
+    parser.add_argument("--verify", type = int, default = 0, help = "How many games to check against connect4.Board")
+    args = parser.parse_args()
+
+    totals = np.zeros(3, dtype = np.int64)
+    mismatches = 0
+    elapsed = 0
+    rng = np.random.default_rng(args.seed)
+
+    for start in range(0, args.games, args.batch):
+        simulator = Simulator(min(args.batch, args.games - start), args.policy, rng.integers(2 ** 32))
+
+        began = time.perf_counter()
+        results = simulator.run()
+        elapsed += time.perf_counter() - began
+
+        totals += np.bincount(results, minlength = 3)
+        if start == 0 and args.verify:
+            mismatches = verify(simulator, args.verify)
+
+    print(f"{args.games} games in {elapsed:.2f}s ({args.games / elapsed:,.0f} games/s)")
+    print(f"Player 1 won {totals[1]}, player 2 won {totals[2]}, {totals[0]} draws")
+
+    if args.verify:
+        print(f"Checked {min(args.verify, args.batch)} games against connect4.Board: {mismatches} mismatches")
+
+if __name__ == "__main__":
+    main()
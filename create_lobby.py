@@ -1,32 +1,153 @@
-import discord, asyncio
+import discord, asyncio, struct, time, statestore, matchmaking, tournament
 from discord import app_commands, ui, Interaction, ButtonStyle as BS, Button
 from discord.ext import commands
+from edits import edits
+
+JOINED = struct.Struct("<Q") # When someone joined, in nanoseconds, so the players stay in the order they joined
+LOBBY_TTL = 60 # Lobbies close after 30 seconds, this is just in case the process stops before it can clear one up
+PAGE_SIZE = 20 # Players on each page of the list, which keeps a page well under Discord's 1024 character limit for a field
+BATCH_TIME = 1.0 # Seconds to collect joins and leaves for before editing the lobby's message
+
+class Roster:
+    # The players in the order they joined. Everyone gets the next slot in `slots` and `slot_of` finds it, so joining and
+    # leaving are O(1): leaving just empties the slot, and the slots get packed back together once a quarter of them are empty.
+    # Every PAGE_SIZE slots is a page, and a page's text is only built again when someone on it joined or left
+    # (or someone before it left, so its numbers changed).
+    def __init__(self):
+        self.slots = [] # User IDs, or None where someone left
+        self.slot_of = {} # User ID: their slot
+        self.counts = [] # How many players are on each page
+        self.rendered = {} # Page: (the number its first player has, its text)
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def __contains__(self, user_id: int):
+        return user_id in self.slot_of
+
+    def __iter__(self):
+        return (user_id for user_id in self.slots if user_id is not None)
+
+    def add(self, user_id: int):
+        page = len(self.slots) // PAGE_SIZE
+        self.slot_of[user_id] = len(self.slots)
+        self.slots.append(user_id)
+        if page == len(self.counts):
+            self.counts.append(0)
+        self.counts[page] += 1
+        self.rendered.pop(page, None)
+
+    def remove(self, user_id: int):
+        slot = self.slot_of.pop(user_id)
+        self.slots[slot] = None
+        self.counts[slot // PAGE_SIZE] -= 1
+        self.rendered.pop(slot // PAGE_SIZE, None)
+
+        while self.slots and self.slots[-1] is None: # Empty slots at the end can just go
+            self.slots.pop()
+        for page in range(-(-len(self.slots) // PAGE_SIZE), len(self.counts)): # And so can the pages they were on
+            self.rendered.pop(page, None)
+        del self.counts[-(-len(self.slots) // PAGE_SIZE):]
+
+        if len(self.slots) - len(self.slot_of) > len(self.slots) // 4:
+            self.pack()
+
+    def pack(self):
+        players = list(self)
+        self.slots, self.slot_of, self.counts, self.rendered = [], {}, [], {}
+        for user_id in players:
+            self.add(user_id)
+
+    def pages(self):
+        # The pages with anyone on them
+        return [page for page, count in enumerate(self.counts) if count]
+
+    def render(self, page: int):
+        first = sum(self.counts[:page]) + 1
+        cached = self.rendered.get(page)
+        if cached is None or cached[0] != first:
+            players = [user_id for user_id in self.slots[page * PAGE_SIZE:(page + 1) * PAGE_SIZE] if user_id is not None]
+            # List the players like this:
+            # 1. ...
+            # 2. ...
+            # 3. ...
+            text = "\n".join(f"{place}. <@{user_id}>" for place, user_id in enumerate(players, start = first))
+            cached = self.rendered[page] = (first, text)
+        return cached[1]
 
 class CreateLobbyView(ui.View):
-    def __init__(self, orchestrator: discord.Member, limit: int = None):
+    # The players are kept in a Roster in this process, which is the one that gets the lobby's button presses.
+    # They're also written to the state store (see statestore.py) as "lobby ID:player ID", so other processes can see the lobby.
+    def __init__(self, lobby_id: int, limit: int = None):
         super().__init__(timeout = None)
-        self.players = [orchestrator] # Set a new list of just the person who made the lobby
-        self.limit = limit 
+        self.lobby_id = lobby_id
+        self.limit = limit
+        self.roster = Roster()
+        self.page = 0 # The page of the list that's showing
+        self.message = None # The lobby's message, once it's been sent
+        self.refreshing = None # The task that edits the message once the current batch of joins and leaves is in
+
+    async def open(self, orchestrator: discord.Member):
+        await self.join(orchestrator.id) # Start with just the person who made the lobby
+
+    async def join(self, user_id: int):
+        # Returns False if they were already in it
+        if user_id in self.roster:
+            return False
+        self.roster.add(user_id)
+        await statestore.store.set("lobbies", f"{self.lobby_id}:{user_id}", JOINED.pack(time.time_ns()), ttl = LOBBY_TTL)
+        return True
+
+    async def leave(self, user_id: int):
+        self.roster.remove(user_id)
+        await statestore.store.delete("lobbies", f"{self.lobby_id}:{user_id}")
+
+    def player_ids(self):
+        return list(self.roster)
+
+    async def close(self):
+        if self.refreshing:
+            self.refreshing.cancel()
+        for user_id in self.player_ids():
+            await statestore.store.delete("lobbies", f"{self.lobby_id}:{user_id}")
+
+    def embed(self, color = discord.Color.blue()):
+        # The lobby's embed, showing the current page of the list
+        pages = self.roster.pages()
+        if self.page not in pages: # Everyone on it left, so go back to the page before it
+            self.page = max([page for page in pages if page < self.page] or pages[:1] or [0])
+        number = pages.index(self.page) + 1 if pages else 1
+        self.previous_page.disabled = number <= 1
+        self.next_page.disabled = number >= len(pages)
 
-    async def display_players(self, interaction: Interaction):
         embed = discord.Embed(
             title = "Players",
-            description = f"There are {len(self.players)}{f' / {self.limit}' if self.limit else ''} in the lobby right now.",
-            color = discord.Color.blue()
+            description = f"There are {len(self.roster)}{f' / {self.limit}' if self.limit else ''} in the lobby right now.",
+            color = color
         )
         embed.add_field(
-            name = "Players",
-            # List the players like this:
-            # 1. ...
-            # 2. ...
-            # 3. ...
-            value = "\n".join([f"{place}. {player.mention}" for place, player in enumerate(self.players, start = 1)])
+            name = f"Players (page {number} of {len(pages)})" if len(pages) > 1 else "Players",
+            value = self.roster.render(self.page) or "Nobody"
         )
-        await interaction.response.edit_message(view = self, embed = embed) # Update the message with the parsed interaction
+        return embed
+
+    async def display_players(self, interaction: Interaction):
+        # Joins and leaves that come in at around the same time are shown with one edit, so a big lobby filling up
+        # doesn't hit the rate limit. The interaction is answered straight away so it doesn't wait for the edit.
+        self.message = interaction.message
+        await interaction.response.defer()
+        if self.refreshing is None:
+            self.refreshing = asyncio.get_running_loop().create_task(self.refresh())
+
+    async def refresh(self):
+        await asyncio.sleep(BATCH_TIME)
+        self.refreshing = None
+        if not self.is_finished():
+            await edits.edit(self.message, embed = self.embed(), view = self)
 
     @ui.button(label = "Join Lobby", style = BS.green)
     async def join_lobby(self, interaction: Interaction, button: Button):
-        if interaction.user in self.players: # If they're already in the lobby
+        if interaction.user.id in self.roster: # If they're already in the lobby
             await interaction.response.send_message(
                 ephemeral = True, embed = discord.Embed(
                     description = "You're already in this lobby!", # Tell the user that
@@ -35,7 +156,7 @@ class CreateLobbyView(ui.View):
             )
             return # Cut the code there
 
-        if self.limit and len(self.players) == self.limit: # If a limit is set and the limit is met (the lobby is full)
+        if self.limit and len(self.roster) >= self.limit: # If a limit is set and the limit is met (the lobby is full)
             await interaction.response.send_message(
                 ephemeral = True, embed = discord.Embed(
                     description = "You can't join that lobby because it's full!", # Tell the user the lobby is full
@@ -44,13 +165,13 @@ class CreateLobbyView(ui.View):
             )
             return # Cut the code there
         
-        self.players.append(interaction.user) # Add the user to the list
+        await self.join(interaction.user.id) # Add the user to the lobby
 
         await self.display_players(interaction) # Display a new embed with the updated list
     
     @ui.button(label = "Leave Lobby", style = BS.red)
     async def leave_lobby(self, interaction: Interaction, button: Button):
-        if interaction.user not in self.players: # If they are not in the lobby (trying to leave something they're not in)
+        if interaction.user.id not in self.roster: # If they are not in the lobby (trying to leave something they're not in)
             await interaction.response.send_message(
                 ephemeral = True, embed = discord.Embed(
                     description = "You're not in this lobby!", # Tell the user that
@@ -59,9 +180,10 @@ class CreateLobbyView(ui.View):
             )
             return
         
-        self.players.remove(interaction.user) # Remove them
+        await self.leave(interaction.user.id) # Remove them
 
-        if len(self.players) == 0:
+        if not self.roster:
+            await self.close()
             await interaction.response.edit_message(
                 view = None, embed = discord.Embed(
                     title = "This lobby is empty!",
@@ -74,6 +196,18 @@ class CreateLobbyView(ui.View):
 
         await self.display_players(interaction) # Display the new list
 
+    @ui.button(label = "◀", style = BS.grey, row = 1, disabled = True)
+    async def previous_page(self, interaction: Interaction, button: Button):
+        pages = self.roster.pages()
+        self.page = max([page for page in pages if page < self.page] or [self.page])
+        await edits.edit(interaction.message, interaction, embed = self.embed(), view = self)
+
+    @ui.button(label = "▶", style = BS.grey, row = 1, disabled = True)
+    async def next_page(self, interaction: Interaction, button: Button):
+        pages = self.roster.pages()
+        self.page = min([page for page in pages if page > self.page] or [self.page])
+        await edits.edit(interaction.message, interaction, embed = self.embed(), view = self)
+
 class Lobby(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
@@ -81,8 +215,20 @@ class Lobby(commands.Cog):
     lobby = app_commands.Group(name = 'lobby', description = "Do stuff with lobbies.")
 
     @lobby.command(name = 'create', description = "Create a lobby.")
-    async def create(self, interaction: Interaction):
-        view = CreateLobbyView(orchestrator = interaction.user, limit = 10) # Create the view
+    @app_commands.describe(limit = "How many people can join", game = "Play a tournament of this when the lobby closes", format = "How the tournament is played")
+    @app_commands.choices(
+        game = [app_commands.Choice(name = name, value = game) for game, name in matchmaking.NAMES.items()],
+        format = [
+            app_commands.Choice(name = "Single elimination", value = tournament.ELIMINATION),
+            app_commands.Choice(name = f"Round robin (up to {tournament.ROUND_ROBIN_LIMIT} players)", value = tournament.ROUND_ROBIN)
+        ]
+    )
+    async def create(
+        self, interaction: Interaction, limit: app_commands.Range[int, 2, 1000] = 10,
+        game: app_commands.Choice[str] = None, format: app_commands.Choice[str] = None
+    ):
+        view = CreateLobbyView(lobby_id = interaction.id, limit = limit) # Create the view
+        await view.open(interaction.user)
         embed = discord.Embed(
             title = "Loading...",
             description = "Creating the lobby for you...",
@@ -95,19 +241,54 @@ class Lobby(commands.Cog):
 
         except asyncio.TimeoutError: # When the lobby closes
             view.stop() # Stop listening for view input
-            embed = discord.Embed(
-                title = "Players",
-                description = f"There are {len(self.players)}{f' / {self.limit}' if self.limit else ''} in the lobby right now.",
-                color = discord.Color.green()
-            )
-            embed.add_field(
-                name = "Players",
-                value = "\n".join([f"{place}. {player.mention}" for place, player in enumerate(self.players, start = 1)])
+            await view.close() # Clear the lobby out of the state store
+            view.page = 0 # Show the start of the list
+            await interaction.edit_original_response(view = None, embed = view.embed(discord.Color.green())) # Update the message with all the people in the lobby
+
+            if game and game.value in matchmaking.games: # Play a tournament with everyone in the lobby
+                players = [member for member in [await self.get_member(interaction.guild, user_id) for user_id in view.player_ids()] if member]
+                if len(players) < 2:
+                    await interaction.followup.send("There weren't enough people for a tournament!")
+                    return
+                await tournament.Tournament(interaction, game.value, players, format.value if format else tournament.ELIMINATION).run()
+
+    async def get_member(self, guild: discord.Guild, user_id: int):
+        # The member, or None if they've left the server
+        member = guild.get_member(user_id)
+        if member is None:
+            try:
+                member = await guild.fetch_member(user_id)
+            except discord.NotFound:
+                return None
+        return member
+
+    @lobby.command(name = 'queue', description = "Wait to be matched with someone near your rating.")
+    @app_commands.describe(game = "The game to play")
+    @app_commands.choices(game = [app_commands.Choice(name = name, value = game) for game, name in matchmaking.NAMES.items()])
+    async def queue(self, interaction: Interaction, game: app_commands.Choice[str]):
+        if interaction.guild_id is None or game.value not in matchmaking.games: # Only in servers, and only if the game's cog is loaded
+            await interaction.response.send_message(f"You can't queue for {game.name} here.", ephemeral = True)
+            return
+
+        entry = await matchmaking.matchmaker.join(game.value, interaction)
+        if entry is None:
+            await interaction.response.send_message(
+                ephemeral = True, embed = discord.Embed(
+                    description = "You're already waiting for a game!",
+                    color = discord.Color.red()
+                )
             )
-            
-            await interaction.followup.edit_message(view = None, embed = embed) # Update the message with all the people in the lobby
+            return
 
-            # You can go further down here with whatever you want
+        entry.view = matchmaking.QueueView(entry)
+        await interaction.response.send_message(
+            ephemeral = True, view = entry.view, embed = discord.Embed(
+                title = f"Looking for a game of {game.name}...",
+                description = f"Your rating is **{entry.rating:.0f}**. You'll be matched with someone close to it, "
+                              f"and the game will be sent here once you are.",
+                color = discord.Color.dark_embed()
+            )
+        )
 
 async def setup(bot):
     await bot.add_cog(Lobby(bot))
@@ -2,6 +2,7 @@ import discord, asqlite, sqlite3, time
 from discord import app_commands, Interaction
 from discord.ext import commands
 from datetime import datetime as dt, timedelta as td
+from metrics import metrics
 
 class Daily(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -14,7 +15,8 @@ class Daily(commands.Cog):
             try:
                 # Retrieve data from the "daily" table
                 # Can change if another table has these details
-                req = await conn.execute("SELECT * FROM daily WHERE user_id = ?", (interaction.user.id,))
+                with metrics.timer("db_seconds", source = "daily"):
+                    req = await conn.execute("SELECT * FROM daily WHERE user_id = ?", (interaction.user.id,))
             
             except sqlite3.OperationalError: # the table doesn't exist, so create it
                 await conn.execute("""
@@ -25,13 +27,15 @@ class Daily(commands.Cog):
                     )
                 """)
             
-            row = await req.fetchone() # Fetch the data
+            with metrics.timer("db_seconds", source = "daily"):
+                row = await req.fetchone() # Fetch the data
         
             if not row: # If the data doesn't exist
-                await conn.execute( # Add the data to the table
-                    "INSERT INTO daily (user_id, last_run) VALUES (?, ?)",
-                    (interaction.user.id, int(time.time()))
-                )
+                with metrics.timer("db_seconds", source = "daily"):
+                    await conn.execute( # Add the data to the table
+                        "INSERT INTO daily (user_id, last_run) VALUES (?, ?)",
+                        (interaction.user.id, int(time.time()))
+                    )
                 # Add coins to a bank account
                 return
             
@@ -54,10 +58,11 @@ class Daily(commands.Cog):
                 coins_per_day = ... # change accordingly
 
                 async with self.pool.acquire() as conn:
-                    # change accordingly
-                    await conn.execute("UPDATE accounts SET wallet = wallet + ? WHERE user_id = ?", (coins_per_day, interaction.user.id))
-                    # update the table with the new streak count
-                    await conn.execute("UPDATE daily SET streak = streak + 1 WHERE user_id = ?", (interaction.user.id,))
+                    with metrics.timer("db_seconds", source = "daily"):
+                        # change accordingly
+                        await conn.execute("UPDATE accounts SET wallet = wallet + ? WHERE user_id = ?", (coins_per_day, interaction.user.id))
+                        # update the table with the new streak count
+                        await conn.execute("UPDATE daily SET streak = streak + 1 WHERE user_id = ?", (interaction.user.id,))
 
                 await interaction.response.send_message(
                     ephemeral = True, embed = discord.Embed(
@@ -68,7 +73,7 @@ class Daily(commands.Cog):
                 )
             else: # streak has been broken (it's been more than a day)
                 await interaction.response.send_message(
-                    ephemeral = True, embed = discord.Emebd(
+                    ephemeral = True, embed = discord.Embed(
                         title = "Your streak ran out!",
                         description = f"You forgot to claim your daily, so you lost your **{row['streak']}** day streak.\nYou last ran this command {discord.utils.format_dt(last_run, style = 'R')}",
                         color = discord.Color.red()
@@ -76,7 +81,8 @@ class Daily(commands.Cog):
                 )
 
                 async with self.pool.acquire() as conn:
-                    await conn.execute("DELETE FROM daily WHERE user_id = ?", (interaction.user.id,)) # Delete the streak entry from the table, since there's no point in keeping it
+                    with metrics.timer("db_seconds", source = "daily"):
+                        await conn.execute("DELETE FROM daily WHERE user_id = ?", (interaction.user.id,)) # Delete the streak entry from the table, since there's no point in keeping it
 
 
 async def setup(bot):
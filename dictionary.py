@@ -6,8 +6,11 @@
 import discord, aiohttp
 from discord import app_commands, ui, Interaction, InteractionMessage, Button, ButtonStyle as BS
 from discord.ext import commands
+from sessions import SessionView
+from edits import edits
+from metrics import metrics
 
-class DictionaryView(ui.View):
+class DictionaryView(SessionView):
     children: list[Button] # type: ignore
     message: InteractionMessage
     
@@ -29,7 +32,7 @@ class DictionaryView(ui.View):
         self.page_count = len(self.definitions['meanings'][0].values()) - 2
 
     async def on_timeout(self) -> None:
-        await self.message.edit(view = None)
+        await edits.edit(self.message, view = None)
 
     async def create_page(self) -> discord.Embed:
         _phonetic = self.definitions.get('phonetic')
@@ -60,7 +63,7 @@ class DictionaryView(ui.View):
        
         return page
     
-    async def display_page(self) -> None:
+    async def display_page(self, interaction: Interaction = None) -> None:
         # Can only go right
         if self.current_page == 0:
             for button in self.children[:2]:
@@ -82,7 +85,9 @@ class DictionaryView(ui.View):
             for button in self.children:
                 button.disabled = False
        
-        await self.message.edit(
+        # Flicking through pages quickly only sends the page they end up on (see edits.py)
+        await edits.edit(
+            self.message, interaction,
             embed = await self.create_page(),
             view = self if self.page_count > 1 else None
         )
@@ -90,26 +95,22 @@ class DictionaryView(ui.View):
     @ui.button(label = '<<', style = BS.grey, disabled = True)
     async def go_to_start(self, interaction: Interaction, _):
         self.current_page = 0
-        await interaction.response.defer()
-        await self.display_page()
+        await self.display_page(interaction)
 
     @ui.button(label = 'Back', style = BS.primary, disabled = True)
     async def go_to_previous(self, interaction: Interaction, _):
         self.current_page -= 1 if self.current_page > 0 else 0
-        await interaction.response.defer()
-        await self.display_page()
+        await self.display_page(interaction)
 
     @ui.button(label = 'Next', style = BS.primary)
     async def go_to_next(self, interaction: Interaction, _):
         self.current_page += 1 if self.current_page < self.page_count else 0
-        await interaction.response.defer()
-        await self.display_page()
+        await self.display_page(interaction)
     
     @ui.button(label = '>>', style = BS.grey)
     async def go_to_end(self, interaction: Interaction, _):
         self.current_page = self.page_count
-        await interaction.response.defer()
-        await self.display_page()
+        await self.display_page(interaction)
 
     @ui.button(label = 'Quit', style = BS.red)
     async def _quit(self, _, __):
@@ -124,22 +125,23 @@ class Dictionary(commands.Cog):
     @app_commands.describe(word = 'The word to search for. Example: "hello"')
     async def define_word(self, interaction: Interaction, word: str):
         async with aiohttp.ClientSession() as session:
-            async with session.get('https://api.dictionaryapi.dev/api/v2/entries/en/' + word) as response:
-                if response.status == 404:
-                    error_embed = discord.Embed(
-                        title = "Word not found!",
-                        description = "Looks like that word isn't in the dictionary. Please try again.",
-                        color = discord.Color.red(),
-                        timestamp = discord.utils.utcnow()
-                    )
-                    
-                    return await interaction.response.send_message(
-                        embed = error_embed,
-                        ephemeral = True
-                    )
+            with metrics.timer("http_seconds", api = "dictionaryapi.dev"): # Time the request on its own, without sending the response
+                async with session.get('https://api.dictionaryapi.dev/api/v2/entries/en/' + word) as response:
+                    status = response.status
+                    definitions = await response.json() if status != 404 else None
 
-                
-                definitions = await response.json()
+        if status == 404:
+            error_embed = discord.Embed(
+                title = "Word not found!",
+                description = "Looks like that word isn't in the dictionary. Please try again.",
+                color = discord.Color.red(),
+                timestamp = discord.utils.utcnow()
+            )
+            
+            return await interaction.response.send_message(
+                embed = error_embed,
+                ephemeral = True
+            )
         
         view = DictionaryView(definitions = definitions[0])
 
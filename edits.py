@@ -0,0 +1,149 @@
+# Sends every game's message edits, so a busy channel doesn't fall behind Discord's rate limits.
+# Each message gets one MessageEditor, which only ever has one edit in flight. Any edits asked for while it's busy are
+# merged into one, so only the latest state of the game gets sent (an edit that's been replaced never needs sending).
+# Edits also wait their turn in their channel's bucket, so they're spread out instead of piling up behind 429s.
+# fakes.py has a pretend Discord to try this out on without a bot.
+
+import asyncio, collections, time
+import discord
+
+class Bucket:
+    # Allows `rate` edits every `per` seconds in a channel, like Discord does
+    def __init__(self, rate: int = 5, per: float = 5.0):
+        self.rate = rate
+        self.per = per
+        self.sent = collections.deque() # When the edits in the current window got to Discord
+        self.sending = 0 # Edits on their way right now
+        self.blocked_until = 0.0 # Set when Discord tells us to slow down
+
+    def delay(self, now: float):
+        # How long to wait before the next edit can go out
+        while self.sent and self.sent[0] <= now - self.per: # Forget edits that are out of the window
+            self.sent.popleft()
+
+        wait = self.blocked_until - now
+        if len(self.sent) + self.sending >= self.rate:
+            # Edits on their way count as sent just after they finish, so a full window with only those in it waits a bit
+            wait = max(wait, self.sent[0] + self.per - now if self.sent else 0.05)
+        return max(wait, 0.0)
+
+    async def __aenter__(self):
+        while wait := self.delay(time.monotonic()):
+            await asyncio.sleep(wait)
+        self.sending += 1
+
+    async def __aexit__(self, *exc):
+        # Count the window from when the edit finished, because that's roughly when Discord counted it
+        self.sending -= 1
+        self.sent.append(time.monotonic())
+
+    def block(self, retry_after: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+class MessageEditor:
+    def __init__(self, scheduler, message: discord.Message):
+        self.scheduler = scheduler
+        self.message = message
+        self.pending = None # The edit that's waiting to go out, with everything asked for since the last one merged in
+        self.done = None # Finishes when the pending edit has been sent
+        self.responder = None # An interaction the pending edit can be sent as a response to
+        self.task = None
+
+    @property
+    def busy(self):
+        return self.task is not None and not self.task.done()
+
+    async def edit(self, interaction: discord.Interaction = None, **kwargs):
+        if self.pending is None:
+            self.pending = {}
+            self.done = asyncio.get_running_loop().create_future()
+        else: # It's going out with the edit that's already waiting
+            self.scheduler.saved += 1
+        self.pending.update(kwargs)
+        self.scheduler.requested += 1
+        done = self.done # run() may take it while we're answering the interaction below
+
+        answer = interaction is not None and not interaction.response.is_done()
+        if answer and not self.busy and self.responder is None:
+            # Nothing is in the way, so answer the interaction with the edit (interaction responses aren't rate limited)
+            self.responder = interaction
+            answer = False
+
+        if not self.busy:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+        if answer: # Answer it now, because the edit might not go out within Discord's 3 seconds
+            await interaction.response.defer()
+
+        await asyncio.shield(done) # Wait for the edit with this change in it to be sent
+
+    async def run(self):
+        while self.pending is not None:
+            kwargs, done, responder = self.pending, self.done, self.responder
+            self.pending = self.done = self.responder = None
+
+            try:
+                if responder:
+                    await responder.response.edit_message(**kwargs)
+                else:
+                    await self.send(kwargs)
+            except Exception as error:
+                done.set_exception(error)
+            else:
+                done.set_result(None)
+                self.scheduler.sent += 1
+
+        self.scheduler.finished(self)
+
+    async def send(self, kwargs: dict):
+        while True:
+            bucket = self.scheduler.bucket(self.message.channel.id)
+            try:
+                async with bucket:
+                    await self.message.edit(**kwargs)
+                return
+            except discord.RateLimited as error: # discord.py gave up waiting, so wait in the bucket and try again
+                self.scheduler.rate_limited += 1
+                bucket.block(error.retry_after)
+
+class EditScheduler:
+    def __init__(self, rate: int = 5, per: float = 5.0):
+        self.rate = rate
+        self.per = per
+        self.editors = {} # Message ID: the message's editor, while it has edits to send
+        self.buckets = {} # Channel ID: bucket
+
+        self.requested = 0 # Edits the games asked for
+        self.sent = 0 # Edits that actually went to Discord
+        self.saved = 0 # Edits that were merged into another one instead of being sent
+        self.rate_limited = 0 # Times Discord said no
+
+    def bucket(self, channel_id: int):
+        if channel_id not in self.buckets:
+            self.buckets[channel_id] = Bucket(self.rate, self.per)
+        return self.buckets[channel_id]
+
+    async def edit(self, message: discord.Message, interaction: discord.Interaction = None, **kwargs):
+        # Use instead of message.edit() or interaction.response.edit_message(). Passing the interaction lets the edit
+        # be sent as its response when nothing else is waiting, and makes sure it's answered in time when something is.
+        editor = self.editors.get(message.id)
+        if editor is None:
+            editor = self.editors[message.id] = MessageEditor(self, message)
+        await editor.edit(interaction, **kwargs)
+
+    def finished(self, editor: MessageEditor):
+        if self.editors.get(editor.message.id) is editor:
+            del self.editors[editor.message.id]
+
+        # Forget the channel's bucket once nothing in it could hold up another edit
+        asyncio.get_running_loop().call_later(self.per, self.forget_bucket, editor.message.channel.id)
+
+    def forget_bucket(self, channel_id: int):
+        bucket = self.buckets.get(channel_id)
+        if bucket and not bucket.delay(time.monotonic()) and not bucket.sent and not bucket.sending:
+            del self.buckets[channel_id]
+
+    def stats(self):
+        return {"requested": self.requested, "sent": self.sent, "saved": self.saved, "rate_limited": self.rate_limited, "waiting": len(self.editors)}
+
+edits = EditScheduler() # Shared by every game
@@ -0,0 +1,26 @@
+# Embeds the games send over and over, like the Connect 4 turn embed, only differ in their description (and sometimes title).
+# An EmbedTemplate builds and serialises everything else once, then render() makes an embed from that saved dict with
+# just the description (and title) swapped in, instead of going through the colour, footer and author every time.
+
+import discord
+
+class EmbedTemplate:
+    def __init__(self, title: str = None, color = None, footer: str = None, author: str = None):
+        self.base = discord.Embed(title = title, color = color)
+        if footer:
+            self.base.set_footer(text = footer)
+        if author:
+            self.base.set_author(name = author)
+
+        self.data = self.base.to_dict() # The static parts, ready to send
+
+    def render(self, description: str = None, title: str = None):
+        data = {**self.data}
+        if description:
+            data["description"] = description
+        if title is not None: # A different title for this one, or none at all if it's empty
+            if title:
+                data["title"] = title
+            else:
+                data.pop("title", None)
+        return discord.Embed.from_dict(data)
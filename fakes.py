@@ -0,0 +1,224 @@
+# A pretend Discord for trying out the games without a bot: messages, interactions and an HTTP layer that rate limits
+# edits per channel the way Discord does. It only has the parts the games use. loadtest.py plays whole games on it.
+# Run it to compare sending every edit straight away with sending them through edits.py:
+#     python fakes.py
+#     python fakes.py --messages 20 --edits 30 --gap 0.01
+
+import argparse, asyncio, collections, itertools, time
+import discord
+
+ids = itertools.count(1)
+
+class FakeHTTP:
+    # Lets `rate` requests through per channel every `per` seconds. Anything over that gets a 429, and like discord.py
+    # it waits out the retry_after and tries again, unless that's longer than max_ratelimit_timeout.
+    def __init__(self, rate: int = 5, per: float = 5.0, latency: float = 0.05, max_ratelimit_timeout: float = None):
+        self.rate = rate
+        self.per = per
+        self.latency = latency # How long each request takes
+        self.max_ratelimit_timeout = max_ratelimit_timeout
+        self.windows = {} # Channel ID: when its recent requests were let through
+
+        self.requests = 0 # Requests that went through
+        self.rate_limited = 0 # 429s
+        self.responses = 0 # Interaction responses, which aren't rate limited
+
+    async def request(self, channel_id: int):
+        while True:
+            await asyncio.sleep(self.latency)
+
+            now = time.monotonic()
+            window = self.windows.setdefault(channel_id, collections.deque())
+            while window and window[0] <= now - self.per:
+                window.popleft()
+
+            if len(window) < self.rate:
+                window.append(now)
+                self.requests += 1
+                return
+
+            self.rate_limited += 1
+            retry_after = window[0] + self.per - now
+            if self.max_ratelimit_timeout is not None and retry_after > self.max_ratelimit_timeout:
+                raise discord.RateLimited(retry_after)
+            await asyncio.sleep(retry_after)
+
+    async def respond(self):
+        await asyncio.sleep(self.latency)
+        self.responses += 1
+
+class FakeUser:
+    def __init__(self, name: str = None, bot: bool = False):
+        self.id = next(ids)
+        self.name = name or f"user{self.id}"
+        self.mention = f"<@{self.id}>"
+        self.display_name = self.name
+        self.bot = bot
+
+class FakeChannel:
+    def __init__(self, http: FakeHTTP):
+        self.id = next(ids)
+        self.http = http
+        self.messages = [] # Every message in the channel, oldest first
+        self.waiting = None # Finishes the next time a message is sent, edited or deleted
+
+    async def send(self, content = None, **kwargs):
+        await self.http.request(self.id)
+        return FakeMessage(self, content = content, **kwargs)
+
+    async def create_thread(self, **kwargs):
+        await self.http.request(self.id)
+        return FakeChannel(self.http) # Threads are channels of their own, with their own rate limits
+
+    def find(self, check):
+        # The newest message `check` is true for
+        for message in reversed(self.messages):
+            if check(message):
+                return message
+
+    def changed(self):
+        # A future that finishes when something in the channel changes
+        if self.waiting is None:
+            self.waiting = asyncio.get_running_loop().create_future()
+        return self.waiting
+
+    def notify(self):
+        if self.waiting is not None:
+            if not self.waiting.done():
+                self.waiting.set_result(None)
+            self.waiting = None
+
+class FakeMessage:
+    def __init__(self, channel: FakeChannel, **kwargs):
+        self.id = next(ids)
+        self.channel = channel
+        self.state = kwargs # What the message looks like now
+        self.edits = 0
+        self.embeds = [kwargs["embed"]] if kwargs.get("embed") else []
+        channel.messages.append(self)
+        channel.notify()
+
+    @property
+    def view(self):
+        return self.state.get("view")
+
+    async def edit(self, **kwargs):
+        await self.channel.http.request(self.channel.id)
+        self.update(kwargs)
+
+    def update(self, kwargs: dict):
+        self.state.update(kwargs)
+        self.edits += 1
+        if kwargs.get("embed"):
+            self.embeds = [kwargs["embed"]]
+        self.channel.notify()
+
+    async def delete(self):
+        await self.channel.http.request(self.channel.id)
+        if self in self.channel.messages:
+            self.channel.messages.remove(self)
+        self.channel.notify()
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def respond(self):
+        if self.done:
+            raise discord.InteractionResponded(self.interaction)
+        self.done = True
+        await self.interaction.channel.http.respond()
+        self.interaction.responded_at = time.perf_counter()
+
+    async def defer(self, **kwargs):
+        await self.respond()
+        if self.interaction.message is None: # A slash command's defer shows a "thinking..." message, which becomes the response
+            self.interaction.original = FakeMessage(self.interaction.channel)
+
+    async def send_message(self, content = None, **kwargs):
+        await self.respond()
+        self.interaction.original = FakeMessage(self.interaction.channel, content = content, **kwargs)
+
+    async def edit_message(self, **kwargs):
+        await self.respond()
+        self.interaction.message.update(kwargs)
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, wait: bool = False, **kwargs):
+        channel = self.interaction.channel
+        await channel.http.request(channel.id)
+        return FakeMessage(channel, **kwargs)
+
+class FakeInteraction:
+    # A button press on `message`, or a slash command in `channel` when there's no message
+    def __init__(self, user: FakeUser, message: FakeMessage = None, channel: FakeChannel = None, data: dict = None):
+        self.id = next(ids)
+        self.user = user
+        self.message = message
+        self.channel = message.channel if message else channel
+        self.guild = None
+        self.guild_id = None
+        self.client = None
+        self.command = None
+        self.data = data or {}
+        self.extras = {}
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.original = None # The message sent as the response
+        self.responded_at = None # When it was responded to, by time.perf_counter()
+
+    async def original_response(self):
+        return self.original or self.message
+
+    async def edit_original_response(self, **kwargs):
+        await self.channel.http.respond()
+        message = self.original or self.message
+        message.update(kwargs)
+        return message
+
+async def burst(messages: int, count: int, gap: float, send):
+    # Everyone presses buttons on every message at once, `gap` seconds apart
+    async def presses(message):
+        tasks = []
+        for move in range(count):
+            tasks.append(asyncio.create_task(send(message, move)))
+            await asyncio.sleep(gap)
+        await asyncio.gather(*tasks)
+
+    http = FakeHTTP(rate = 5, per = 1.0)
+    channel = FakeChannel(http)
+    start = time.monotonic()
+    await asyncio.gather(*(presses(FakeMessage(channel)) for _ in range(messages)))
+    return http, time.monotonic() - start
+
+async def main():
+    from edits import EditScheduler
+
+    parser = argparse.ArgumentParser(description = "Compare editing messages directly with coalescing the edits.")
+    parser.add_argument("--messages", type = int, default = 5, help = "How many games are going in the channel")
+    parser.add_argument("--edits", type = int, default = 20, help = "How many moves each game gets")
+    parser.add_argument("--gap", type = float, default = 0.02, help = "Seconds between moves")
+    args = parser.parse_args()
+
+    async def direct(message, move):
+        await message.edit(content = move)
+
+    http, elapsed = await burst(args.messages, args.edits, args.gap, direct)
+    print(f"direct:    {http.requests} edits, {http.rate_limited} 429s, {elapsed:.2f}s")
+
+    scheduler = EditScheduler(rate = 5, per = 1.0)
+    async def coalesced(message, move):
+        await scheduler.edit(message, content = move)
+
+    http, elapsed = await burst(args.messages, args.edits, args.gap, coalesced)
+    print(f"coalesced: {http.requests} edits, {http.rate_limited} 429s, {elapsed:.2f}s, {scheduler.saved} edits saved")
+
+if __name__ == "__main__":
+    asyncio.run(main())
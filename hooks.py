@@ -0,0 +1,57 @@
+# Wraps methods on discord.py's classes, for the places it doesn't have a hook of its own (like its HTTP requests, or every
+# view's callbacks whatever the view inherits from). metrics.py and profiling.py both wrap View._scheduled_task, so
+# instead of patching over each other they go through here:
+#     hooks.wrap(ui.View, "_scheduled_task", "metrics", timed_callback, order = 0)
+#     hooks.unwrap(ui.View, "_scheduled_task", "metrics")
+# Each method keeps its original and one wrapper per key, so installing twice never wraps it twice, and wrappers are
+# applied by `order` (lowest innermost) whichever was installed first. Taking the last one off puts the original back.
+
+hooks = {} # (class, method name): Hook
+
+class Hook:
+    def __init__(self, owner: type, name: str):
+        self.owner = owner
+        self.name = name
+        self.inherited = name not in owner.__dict__ # Like View._scheduled_task, which is really BaseView's
+        self.original = getattr(owner, name)
+        self.wrappers = {} # Key: (order, function that takes the method and returns the wrapped method)
+        self.current = self.original # What's on the class now
+
+    def check(self):
+        if getattr(self.owner, self.name) is not self.current:
+            raise RuntimeError(f"{self.owner.__name__}.{self.name} was replaced by something else, so it can't be wrapped safely")
+
+    def apply(self):
+        method = self.original
+        for _, wrapper in sorted(self.wrappers.values(), key = lambda pair: pair[0]):
+            method = wrapper(method)
+
+        if method is self.original and self.inherited:
+            delattr(self.owner, self.name)
+        else:
+            setattr(self.owner, self.name, method)
+        self.current = method
+
+def wrap(owner: type, name: str, key: str, wrapper, order: int = 0):
+    hook = hooks.get((owner, name))
+    if hook is None:
+        hook = hooks[owner, name] = Hook(owner, name)
+    hook.check()
+    hook.wrappers[key] = (order, wrapper)
+    hook.apply()
+
+def unwrap(owner: type, name: str, key: str):
+    hook = hooks.get((owner, name))
+    if hook is None or key not in hook.wrappers:
+        return
+
+    hook.check()
+    del hook.wrappers[key]
+    hook.apply()
+    if not hook.wrappers: # Back to the original
+        del hooks[owner, name]
+
+def wrapped(owner: type, name: str):
+    # The keys wrapping a method right now, innermost first
+    hook = hooks.get((owner, name))
+    return [key for key, _ in sorted(hook.wrappers.items(), key = lambda item: item[1][0])] if hook else []
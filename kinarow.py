@@ -0,0 +1,83 @@
+# Win checking for any game where you need K counters in a row on a grid: tic-tac-toe (3x3, 3 in a row),
+# Connect 4 (7x6, 4 in a row), or bigger ones like 9x7 connect 5.
+# Every line you can win with is worked out once for each size of board and stored as a bitmask,
+# along with which lines go through each cell, so checking for a win is just a few mask tests.
+# Cells are numbered row by row from the top left: cell = row * width + column.
+
+from functools import lru_cache
+
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1)) # Across, down and the two diagonals, as (row, column) steps
+
+class Lines:
+    def __init__(self, width: int, height: int, k: int):
+        self.width = width
+        self.height = height
+        self.k = k
+        self.full = (1 << width * height) - 1 # Every cell on the board
+
+        lines = []
+        for row in range(height):
+            for column in range(width):
+                for dy, dx in DIRECTIONS:
+                    end_row, end_column = row + dy * (k - 1), column + dx * (k - 1)
+                    if 0 <= end_row < height and 0 <= end_column < width:
+                        lines.append(sum(1 << (row + dy * i) * width + column + dx * i for i in range(k)))
+
+        self.lines = tuple(lines)
+        # The lines going through each cell, so only those need checking after a move
+        self.through = tuple(
+            tuple(line for line in self.lines if line >> cell & 1) for cell in range(width * height)
+        )
+
+@lru_cache(maxsize = None)
+def lines(width: int, height: int, k: int) -> Lines:
+    return Lines(width, height, k)
+
+class KInARow:
+    def __init__(self, width: int, height: int, k: int):
+        self.lines = lines(width, height, k)
+        self.masks = [0, 0] # Player 1 and player 2's cells
+
+    @classmethod
+    def from_grid(cls, grid, k: int, pieces = (1, 2)):
+        # Build the game from a list of rows, with `pieces` being what player 1 and player 2's cells hold.
+        game = cls(len(grid[0]), len(grid), k)
+        cell = 0
+        for line in grid:
+            for item in line:
+                if item == pieces[0]:
+                    game.masks[0] |= 1 << cell
+                elif item == pieces[1]:
+                    game.masks[1] |= 1 << cell
+                cell += 1
+        return game
+
+    def place(self, cell: int, player: int):
+        # Put a player's counter in a cell, and return the player if that won them the game
+        self.masks[player - 1] |= 1 << cell
+        return self.winner_at(cell, player)
+
+    def winner_at(self, cell: int, player: int):
+        # Only the lines through the cell that was just played can have been finished by it
+        mask = self.masks[player - 1]
+        for line in self.lines.through[cell]:
+            if mask & line == line:
+                return player
+
+    def winner(self):
+        # Check every line, for when we don't know which move was last
+        for player, mask in enumerate(self.masks, start = 1):
+            for line in self.lines.lines:
+                if mask & line == line:
+                    return player
+
+    def is_full(self):
+        return self.masks[0] | self.masks[1] == self.lines.full
+
+    def check(self):
+        # Same results as connect4.Board.check: the player who won, False for a draw, or None if the game is still going
+        winner = self.winner()
+        if winner:
+            return winner
+        if self.is_full():
+            return False
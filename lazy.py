@@ -0,0 +1,68 @@
+# Keeps startup quick as the games grow. The cogs (and their slash commands) load straight away, but anything slow to build,
+# like tictactoe_solver solving every position, is only imported once something needs it:
+#     tictactoe_solver = lazy.module("tictactoe_solver") # Instead of `import tictactoe_solver`
+# Once the cogs are loaded, warm() imports them in a thread so the first game doesn't have to wait.
+# Set LAZY_LOAD=0 to import everything straight away instead, like before.
+# load_extensions() loads the cogs and logs how long each one took, so it's easy to see which one made startup slower:
+#     await lazy.load_extensions(bot, "connect4", "tictactoe", "rockpaperscissors", "create_lobby") # In setup_hook
+
+import asyncio, importlib, logging, os, threading, time
+from metrics import metrics
+
+log = logging.getLogger(__name__)
+LAZY = os.environ.get("LAZY_LOAD", "1") != "0"
+
+class LazyModule:
+    # Stands in for a module until something on it is used, then imports it
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock() # warm() imports from another thread
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    seconds = time.perf_counter() - start
+                    metrics.observe("engine_load_seconds", seconds, module = self._name)
+                    log.info("Imported %s in %.0fms", self._name, seconds * 1000)
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, key):
+        return getattr(self.load(), key)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}{' (loaded)' if self._module else ''}>"
+
+modules = {} # Name: LazyModule, so every cog shares one
+
+def module(name: str):
+    if name not in modules:
+        modules[name] = LazyModule(name)
+        if not LAZY:
+            modules[name].load()
+    return modules[name]
+
+async def warm():
+    # Import everything that's still waiting, in a thread so the event loop keeps going
+    loop = asyncio.get_running_loop()
+    for lazy_module in list(modules.values()):
+        if lazy_module._module is None:
+            await loop.run_in_executor(None, lazy_module.load)
+
+async def load_extensions(bot, *names: str):
+    # bot.load_extension() for each one, timed (that includes importing it)
+    total = time.perf_counter()
+    for name in names:
+        start = time.perf_counter()
+        await bot.load_extension(name)
+        seconds = time.perf_counter() - start
+        metrics.observe("cog_load_seconds", seconds, cog = name)
+        log.info("Loaded %s in %.0fms", name, seconds * 1000)
+
+    log.info("Loaded %d cogs in %.0fms", len(names), (time.perf_counter() - total) * 1000)
+    if LAZY:
+        asyncio.get_running_loop().create_task(warm())
@@ -0,0 +1,212 @@
+# Plays thousands of games at once on the pretend Discord in fakes.py, through the real cogs and views, to see how many
+# one process can keep up with. Every game starts from its slash command and is played by pressing the buttons the way
+# discord.py would (View._scheduled_task), with a random pause between presses like a person thinking.
+#     python loadtest.py
+#     python loadtest.py --games 2000 --think 0.5 --latency 0.08
+# At the end it prints interactions per second, how long commands took to respond and button presses took to finish,
+# how far behind the event loop fell, and the most memory the process used.
+
+import argparse, asyncio, random, resource, statistics, time
+from discord import ui
+from fakes import FakeHTTP, FakeUser, FakeChannel, FakeInteraction
+from metrics import metrics
+
+import connect4, tictactoe, rockpaperscissors, create_lobby
+from _requestplayview import RequestToPlayView
+
+LAG_INTERVAL = 0.05 # How often the event loop's lag is checked
+
+class FakeBot:
+    def __init__(self):
+        self.user = FakeUser("bot", bot = True)
+
+class LoadTest:
+    def __init__(self, think: float, latency: float):
+        self.think = think # Longest pause between someone's presses
+        self.http = FakeHTTP(latency = latency)
+        bot = FakeBot()
+        self.cogs = (connect4.Connect4(bot), tictactoe.TicTacToe(bot), rockpaperscissors.RockPaperScissors(bot), create_lobby.Lobby(bot))
+
+        self.interactions = 0
+        self.responses = [] # Seconds from each command being run to its first response
+        self.presses = [] # Seconds each button press took to finish
+        self.lag = [] # Seconds the event loop was late by
+        self.errors = [] # Everything that went wrong, as (game, exception)
+        self.finished = {} # Game: how many finished
+
+    async def pause(self):
+        await asyncio.sleep(random.uniform(0, self.think))
+
+    def run_command(self, command, user: FakeUser, channel: FakeChannel, **params):
+        # Start a slash command the way discord.py does, and return its task
+        interaction = FakeInteraction(user, channel = channel)
+        start = time.perf_counter()
+        self.interactions += 1
+
+        async def run():
+            try:
+                return await command._do_call(interaction, params)
+            finally:
+                if interaction.responded_at is not None:
+                    self.responses.append(interaction.responded_at - start)
+
+        return asyncio.get_running_loop().create_task(run())
+
+    async def press(self, view: ui.View, item: ui.Item, user: FakeUser, message):
+        interaction = FakeInteraction(user, message, data = {"custom_id": item.custom_id, "component_type": 2})
+        start = time.perf_counter()
+        await asyncio.get_running_loop().create_task(view._scheduled_task(item, interaction)) # Like View._dispatch_item
+        self.presses.append(time.perf_counter() - start)
+        self.interactions += 1
+
+    async def next_view(self, channel: FakeChannel, kind: type, command: asyncio.Task):
+        # Wait for the command to show a view of this kind that's still going, and return its message, or None if it finished
+        def live(message):
+            return isinstance(message.view, kind) and not message.view.is_finished()
+
+        while not command.done():
+            message = channel.find(live)
+            if message:
+                return message
+            await asyncio.wait([channel.changed(), command], return_when = asyncio.FIRST_COMPLETED)
+
+    async def challenge(self, channel: FakeChannel, opponent: FakeUser, command: asyncio.Task):
+        # The opponent accepts the challenge
+        message = await self.next_view(channel, RequestToPlayView, command)
+        if message:
+            await self.pause()
+            await self.press(message.view, message.view.accept, opponent, message)
+
+    async def connect4(self, channel: FakeChannel):
+        players = FakeUser(), FakeUser()
+        command = self.run_command(self.cogs[0].connect4, players[0], channel, opponent = players[1])
+        await self.challenge(channel, players[1], command)
+
+        message = await self.next_view(channel, connect4.Columns, command)
+        while message and not message.view.is_finished():
+            await self.pause()
+            view = message.view
+            columns = [item for item in view.children if isinstance(item, connect4.ColumnsButton) and not item.disabled]
+            await self.press(view, random.choice(columns), view.players[view.player], message)
+
+        await command
+
+    async def tictactoe(self, channel: FakeChannel):
+        players = FakeUser(), FakeUser()
+        command = self.run_command(self.cogs[1].tictactoe, players[0], channel, opponent = players[1])
+        await self.challenge(channel, players[1], command)
+        await command # It returns once the game has been sent
+
+        message = channel.find(lambda message: isinstance(message.view, tictactoe.TicTacToeView))
+        while message and not message.view.is_finished():
+            await self.pause()
+            view = message.view
+            await self.press(view, random.choice([item for item in view.children if not item.disabled]), view.players[view.turn], message)
+
+    async def rockpaperscissors(self, channel: FakeChannel):
+        players = FakeUser(), FakeUser()
+        command = self.run_command(self.cogs[2].rps, players[0], channel, opponent = players[1], rounds = random.choice((1, 3)))
+        await self.challenge(channel, players[1], command)
+
+        async def choose(view, player, message):
+            await self.pause()
+            await self.press(view, random.choice(view.children), player, message)
+
+        # Both players choose at the same time, every round
+        while message := await self.next_view(channel, rockpaperscissors.RockPaperScissorsView, command):
+            view = message.view
+            await asyncio.gather(*(choose(view, player, message) for player in players)) # The last choice ends the round
+
+        await command
+
+    async def lobby(self, channel: FakeChannel):
+        orchestrator = FakeUser()
+        command = self.run_command(self.cogs[3].lobby.get_command("create"), orchestrator, channel)
+        message = await self.next_view(channel, create_lobby.CreateLobbyView, command)
+
+        # A few people join, then everyone leaves, which closes the lobby
+        view = message.view
+        players = [FakeUser() for _ in range(random.randint(1, 8))]
+        presses = [(view.join_lobby, player) for player in players] + [(view.leave_lobby, player) for player in [orchestrator, *players]]
+        for button, player in presses:
+            await self.pause()
+            if view.is_finished(): # It closed before everyone had left, lobbies only stay open for 30 seconds
+                break
+            await self.press(view, button, player, message)
+
+        await command
+
+    async def play(self, game: str, delay: float):
+        await asyncio.sleep(delay)
+        try:
+            await getattr(self, game)(FakeChannel(self.http)) # Every game gets its own channel, like in a real server
+        except Exception as error:
+            self.errors.append((game, error))
+        else:
+            self.finished[game] = self.finished.get(game, 0) + 1
+
+    async def watch_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.lag.append(loop.time() - start - LAG_INTERVAL)
+
+    async def run(self, games: dict, ramp: float):
+        watcher = asyncio.get_running_loop().create_task(self.watch_lag())
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            self.play(game, random.uniform(0, ramp)) for game, count in games.items() for _ in range(count)
+        ))
+        elapsed = time.perf_counter() - start
+        watcher.cancel()
+        return elapsed
+
+def percentile(values: list, p: int):
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n = 100, method = "inclusive")[p - 1]
+
+def milliseconds(values: list):
+    return f"p50 {percentile(values, 50) * 1000:.1f}ms  p99 {percentile(values, 99) * 1000:.1f}ms  max {max(values, default = 0) * 1000:.1f}ms"
+
+def on_error(self, interaction, error, item):
+    # Pass errors in callbacks on to the game that pressed the button, instead of just logging them
+    raise error
+
+async def main():
+    parser = argparse.ArgumentParser(description = "Play lots of games at once on a pretend Discord and measure how the bot keeps up.")
+    parser.add_argument("--games", type = int, default = 1000, help = "How many of each game to play")
+    parser.add_argument("--only", nargs = "+", choices = ("connect4", "tictactoe", "rockpaperscissors", "lobby"), help = "Only play these games")
+    parser.add_argument("--ramp", type = float, default = 5.0, help = "Seconds to spread the games' starts over")
+    parser.add_argument("--think", type = float, default = 0.5, help = "Longest pause between someone's button presses, in seconds")
+    parser.add_argument("--latency", type = float, default = 0.05, help = "How long each request to Discord takes, in seconds")
+    parser.add_argument("--seed", type = int, help = "Seed the random moves to play the same games again")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    metrics.install(None) # For the time each view's callbacks took
+    ui.View.on_error = on_error
+
+    test = LoadTest(args.think, args.latency)
+    games = dict.fromkeys(args.only or ("connect4", "tictactoe", "rockpaperscissors", "lobby"), args.games)
+    elapsed = await test.run(games, args.ramp)
+
+    print(f"{sum(test.finished.values())} of {sum(games.values())} games finished in {elapsed:.2f}s: " + ", ".join(f"{count} {game}" for game, count in test.finished.items()))
+    print(f"interactions:     {test.interactions} ({test.interactions / elapsed:.0f}/s)")
+    print(f"command response: {milliseconds(test.responses)}")
+    print(f"button press:     {milliseconds(test.presses)}")
+    print(f"event loop lag:   {milliseconds(test.lag)}")
+    print(f"peak RSS:         {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}MB") # ru_maxrss is in KB on Linux
+    print(f"discord requests: {test.http.requests} ({test.http.rate_limited} rate limited), {test.http.responses} interaction responses")
+
+    print("\nslowest callbacks:")
+    for labels, count, median, p95, slowest in sorted(metrics.summary("view_callback_seconds"), key = lambda row: row[3], reverse = True)[:8]:
+        print(f"  {labels['view']}.{labels['item']}: {count}x  p50 {median * 1000:.1f}ms  p95 {p95 * 1000:.1f}ms  max {slowest * 1000:.1f}ms")
+
+    if test.errors:
+        print(f"\n{len(test.errors)} games went wrong, the first was in {test.errors[0][0]}:")
+        raise test.errors[0][1]
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,202 @@
+# Pairs people up for games by rating, instead of someone having to challenge someone else.
+# /lobby queue puts someone in their server's queue for a game, and every TICK seconds the queues are paired off in one go:
+# each player gets the next closest rating, as long as the difference is within both of their ranges. The range starts at
+# SPREAD and widens the longer someone waits, so nobody waits forever just because nobody near their rating is around.
+# Players wait in buckets of BUCKET_WIDTH rating points, in the order they joined, so joining and leaving are O(1) and
+# a tick walks the buckets in rating order. Games add themselves to `games` (like persistence.restorers), and their
+# results update everyone's rating, which is kept in the state store (see statestore.py) for each game.
+
+import asyncio, logging, struct, time, statestore
+import discord
+from discord import ui, Interaction, ButtonStyle as BS, Button
+
+log = logging.getLogger(__name__)
+
+TICK = 2.0 # Seconds between pairing everyone up
+BUCKET_WIDTH = 50 # Rating points in each bucket
+SPREAD = 100 # The rating difference someone will play against when they start waiting
+SPREAD_PER_SECOND = 5 # How much further that goes for every second they wait
+MAX_WAIT = 10 * 60 # Seconds someone can wait before they're told nobody's around
+DEFAULT_RATING = 1000.0
+K = 32 # The most a rating can change by in one game
+RATING = struct.Struct("<d")
+
+games = {} # Game: async function(send, *players) that sends a game with `send` and returns its view, added by each game's module
+NAMES = {"connect4": "Connect 4", "tictactoe": "Tic-Tac-Toe"}
+
+async def get_rating(game: str, user_id: int):
+    value = await statestore.store.get("ratings", f"{game}:{user_id}")
+    return RATING.unpack(value)[0] if value else DEFAULT_RATING
+
+async def record(game: str, first: discord.Member, second: discord.Member, winner: discord.Member = None):
+    # Update both players' ratings after a game (Elo), where no winner means it was a draw
+    first_rating, second_rating = await get_rating(game, first.id), await get_rating(game, second.id)
+    expected = 1 / (1 + 10 ** ((second_rating - first_rating) / 400)) # How likely the first player was to win
+    score = 0.5 if winner is None else float(winner == first)
+    change = K * (score - expected)
+
+    await statestore.store.set("ratings", f"{game}:{first.id}", RATING.pack(first_rating + change))
+    await statestore.store.set("ratings", f"{game}:{second.id}", RATING.pack(second_rating - change))
+
+class Entry:
+    # Someone waiting in a queue
+    __slots__ = ("user", "rating", "joined", "interaction", "view", "queue", "bucket")
+
+    def __init__(self, user: discord.Member, rating: float, interaction: Interaction, joined: float):
+        self.user = user
+        self.rating = rating
+        self.joined = joined
+        self.interaction = interaction # Their /lobby queue, whose message says when they've found a game
+        self.view = None # The message with their leave button
+        self.queue = None
+        self.bucket = None
+
+    def spread(self, now: float):
+        return SPREAD + SPREAD_PER_SECOND * (now - self.joined)
+
+class MatchQueue:
+    def __init__(self, game: str, guild_id: int):
+        self.game = game
+        self.guild_id = guild_id
+        self.buckets = {} # Rating // BUCKET_WIDTH: {user ID: entry}, in the order they joined
+        self.size = 0
+
+    def add(self, entry: Entry):
+        entry.queue = self
+        entry.bucket = int(entry.rating // BUCKET_WIDTH)
+        self.buckets.setdefault(entry.bucket, {})[entry.user.id] = entry
+        self.size += 1
+
+    def remove(self, entry: Entry):
+        bucket = self.buckets[entry.bucket]
+        del bucket[entry.user.id]
+        if not bucket:
+            del self.buckets[entry.bucket]
+        entry.queue = None
+        self.size -= 1
+
+    def pair(self, now: float):
+        # Take everyone who can play each other out of the queue, along with anyone who's waited too long.
+        # Returns ([(entry, entry), ...], [entry, ...])
+        pairs, expired = [], []
+        passed = None # The last person passed over, who could still play the next one along
+
+        for key in sorted(self.buckets):
+            for entry in list(self.buckets.get(key, {}).values()):
+                if now - entry.joined > MAX_WAIT:
+                    self.remove(entry)
+                    expired.append(entry)
+                elif passed and abs(entry.rating - passed.rating) <= min(entry.spread(now), passed.spread(now)):
+                    self.remove(passed)
+                    self.remove(entry)
+                    pairs.append((passed, entry))
+                    passed = None
+                else:
+                    passed = entry
+
+        return pairs, expired
+
+class Matchmaker:
+    def __init__(self):
+        self.queues = {} # (game, guild ID): queue
+        self.entries = {} # User ID: their entry, because people can only wait for one game at a time
+        self.task = None
+
+    def queue(self, game: str, guild_id: int):
+        key = (game, guild_id)
+        if key not in self.queues:
+            self.queues[key] = MatchQueue(game, guild_id)
+        return self.queues[key]
+
+    async def join(self, game: str, interaction: Interaction):
+        # Put them in the queue for their server, and return their entry (or None if they're already waiting)
+        if interaction.user.id in self.entries:
+            return None
+
+        entry = Entry(interaction.user, await get_rating(game, interaction.user.id), interaction, time.monotonic())
+        if interaction.user.id in self.entries: # They joined twice at once
+            return None
+
+        self.entries[entry.user.id] = entry
+        self.queue(game, interaction.guild_id).add(entry)
+
+        if self.task is None or self.task.done(): # Start pairing if nobody else was waiting
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        return entry
+
+    def leave(self, user_id: int):
+        entry = self.entries.pop(user_id, None)
+        if entry and entry.queue:
+            entry.queue.remove(entry)
+        return entry
+
+    async def run(self):
+        while self.entries:
+            await asyncio.sleep(TICK)
+            self.tick(time.monotonic())
+
+    def tick(self, now: float):
+        loop = asyncio.get_running_loop()
+        for key, queue in list(self.queues.items()):
+            pairs, expired = queue.pair(now)
+
+            for first, second in pairs:
+                del self.entries[first.user.id], self.entries[second.user.id]
+                loop.create_task(self.play(queue.game, first, second))
+
+            for entry in expired:
+                del self.entries[entry.user.id]
+                loop.create_task(self.expire(entry))
+
+            if not queue.size:
+                del self.queues[key]
+
+    async def play(self, game: str, first: Entry, second: Entry):
+        if first.joined > second.joined: # The game goes in the channel of whoever's waited longest
+            first, second = second, first
+
+        try:
+            for entry, opponent in ((first, second), (second, first)):
+                entry.view.stop()
+                await entry.interaction.edit_original_response(
+                    view = None, embed = discord.Embed(
+                        description = f"Found you a game of {NAMES[game]} against {opponent.user.mention}!",
+                        color = discord.Color.green()
+                    )
+                )
+
+            # Sent to the channel, not as a followup, because followups stop working 15 minutes after /lobby queue
+            view = await games[game](first.interaction.channel.send, first.user, second.user)
+            await view.wait() # Some games are still going when they've been sent
+            if not view.evicted: # It didn't finish if it got dropped from memory (see persistence.py)
+                await record(game, first.user, second.user, view.winner)
+        except Exception:
+            log.exception("Ranked %s game between %s and %s failed", game, first.user.id, second.user.id)
+
+    async def expire(self, entry: Entry):
+        entry.view.stop()
+        await entry.interaction.edit_original_response(
+            view = None, embed = discord.Embed(
+                description = "Nobody's around to play right now. Try again later!",
+                color = discord.Color.red()
+            )
+        )
+
+    def stats(self):
+        return {"waiting": len(self.entries), "queues": len(self.queues)}
+
+matchmaker = Matchmaker() # Shared by every game
+
+class QueueView(ui.View):
+    # The button to stop waiting, on the message telling someone they're in the queue
+    def __init__(self, entry: Entry):
+        super().__init__(timeout = None) # The matchmaker stops it
+        self.entry = entry
+
+    @ui.button(label = "Leave Queue", style = BS.red)
+    async def leave_queue(self, interaction: Interaction, button: Button):
+        matchmaker.leave(interaction.user.id)
+        self.stop()
+        await interaction.response.edit_message(
+            view = None, embed = discord.Embed(description = "You left the queue.", color = discord.Color.dark_embed())
+        )
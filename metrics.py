@@ -0,0 +1,262 @@
+# Times how long the bot takes to answer interactions, and where that time goes.
+# Call metrics.install(bot) once (in setup_hook, next to the sync command) and it records:
+#   - how long each command and view took to send its first response, counted from when Discord created the interaction,
+#     so it shows how close it came to the 3 second deadline
+#   - how long each view callback ran for
+#   - how long Discord's API took, by route, and how long the database and other APIs took (timed with metrics.timer())
+#   - how many views, games and challenges are open right now
+# Everything is kept as Prometheus histograms. Set METRICS_FILE to have it written out in Prometheus' text format every
+# EXPORT_INTERVAL seconds (for node_exporter's textfile collector), and the owner-only !stats command sums it up.
+
+import asyncio, contextlib, os, time
+import discord, hooks
+from discord import ui
+
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 2.5, 3.0, 5.0, 10.0) # Seconds, with extra detail near the 3 second deadline
+DEADLINE = 3.0 # Discord drops interactions that aren't answered in this long
+EXPORT_INTERVAL = 15
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS) # How many were at most each bucket's size (not counting the smaller buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float):
+        # An estimate, assuming everything in a bucket is spread evenly across it
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(BUCKETS, self.counts):
+            if count and seen + count >= rank:
+                return min(lower + (bound - lower) * (rank - seen) / count, self.max)
+            seen += count
+            lower = bound
+        return self.max # It's past the biggest bucket
+
+class Metrics:
+    def __init__(self):
+        self.histograms = {} # (name, labels): histogram
+        self.counters = {} # (name, labels): count
+        self.collectors = [open_things] # Functions that return [(name, labels, value)] for gauges, called when exporting
+        self.installed = False
+        self.task = None # Writing METRICS_FILE
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+    def increment(self, name: str, amount: int = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        # with metrics.timer("db_seconds", source = "daily"): ...
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def responded(self, interaction: discord.Interaction):
+        # Called when an interaction gets its first response
+        seconds = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+        name = command_name(interaction)
+        self.observe("interaction_response_seconds", seconds, command = name)
+        if seconds > DEADLINE:
+            self.increment("interactions_late_total", command = name)
+
+    def install(self, bot):
+        # Start timing everything. Safe to call more than once.
+        # discord.py has no hooks for its HTTP requests or for every view's callbacks, so these are wrapped (see hooks.py)
+        if self.installed:
+            return
+        self.installed = True
+
+        for owner, name, wrapper in PATCHES:
+            hooks.wrap(owner, name, "metrics", wrapper)
+
+        if os.environ.get("METRICS_FILE"):
+            self.task = asyncio.get_running_loop().create_task(self.export_loop(os.environ["METRICS_FILE"]))
+
+    def uninstall(self):
+        # Stop timing, and put discord.py back how it was. What's been recorded so far is kept.
+        if not self.installed:
+            return
+        self.installed = False
+
+        for owner, name, _ in PATCHES:
+            hooks.unwrap(owner, name, "metrics")
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    def gauges(self):
+        values = []
+        for collector in self.collectors:
+            values.extend(collector())
+        return values
+
+    def export(self):
+        # Everything in Prometheus' text format
+        lines = []
+        described = set()
+
+        def describe(name: str, kind: str):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            describe(name, "histogram")
+            total = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                total += count
+                lines.append(f"{name}_bucket{format_labels(labels, le = bound)} {total}")
+            lines.append(f"{name}_bucket{format_labels(labels, le = '+Inf')} {histogram.count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+        for (name, labels), count in sorted(self.counters.items()):
+            describe(name, "counter")
+            lines.append(f"{name}{format_labels(labels)} {count}")
+
+        for name, labels, value in self.gauges():
+            describe(name, "gauge")
+            lines.append(f"{name}{format_labels(tuple(sorted(labels.items())))} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        # Write to a temporary file first so nothing ever reads half of it
+        with open(path + ".tmp", "w") as file:
+            file.write(self.export())
+        os.replace(path + ".tmp", path)
+
+    async def export_loop(self, path: str):
+        while True:
+            self.write(path)
+            await asyncio.sleep(EXPORT_INTERVAL)
+
+    def summary(self, name: str):
+        # [(labels, count, median, 95th percentile, slowest)] for one histogram, busiest first
+        rows = [
+            (dict(labels), histogram.count, histogram.quantile(0.5), histogram.quantile(0.95), histogram.max)
+            for (histogram_name, labels), histogram in self.histograms.items() if histogram_name == name
+        ]
+        return sorted(rows, key = lambda row: row[1], reverse = True)
+
+HELP = {
+    "interaction_response_seconds": "Time from Discord creating an interaction to the bot's first response to it.",
+    "interactions_late_total": f"Interactions whose first response came after the {DEADLINE:g} second deadline.",
+    "view_callback_seconds": "Time spent running a view's button or select callback.",
+    "slow_callback_steps_total": "Times a callback held the event loop for longer than PROFILE_SLOW_MS (see profiling.py).",
+    "discord_http_seconds": "Time spent on requests to Discord's API, including waiting out rate limits.",
+    "db_seconds": "Time spent on database queries.",
+    "http_seconds": "Time spent on requests to APIs other than Discord's.",
+    "cog_load_seconds": "Time taken to import and set up each cog at startup.",
+    "engine_load_seconds": "Time taken to import each lazily loaded module (see lazy.py) the first time it was needed.",
+    "open_sessions": "Views being timed by the session manager, by view.",
+    "players_in_sessions": "Users with at least one open view.",
+    "live_games": "Saved games that are in memory.",
+    "open_challenges": "Challenges waiting for an answer in this process.",
+    "queued_players": "Users waiting in a matchmaking queue.",
+    "edits_requested": "Message edits the games have asked for.",
+    "edits_sent": "Message edits sent to Discord.",
+    "edits_saved": "Message edits merged into a later one instead of being sent.",
+    "edits_rate_limited": "Message edits Discord rate limited.",
+    "edits_waiting": "Messages with edits waiting to be sent."
+}
+
+def format_labels(labels: tuple, **extra):
+    labels = labels + tuple(extra.items())
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def command_name(interaction: discord.Interaction):
+    # "/connect4" for commands, the view's name for buttons
+    if "view" in interaction.extras:
+        return interaction.extras["view"]
+    if interaction.command:
+        return "/" + interaction.command.qualified_name
+    return "other"
+
+def callback_name(item: ui.Item):
+    # The name of the function a button runs: the decorated method for @ui.button, otherwise the button's class
+    callback = getattr(item.callback, "callback", None)
+    return callback.__name__ if callback else type(item).__name__
+
+def first_response(method):
+    async def wrapper(self, *args, **kwargs):
+        first = not self.is_done()
+        result = await method(self, *args, **kwargs)
+        if first:
+            metrics.responded(self._parent)
+        return result
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+def timed_request(method):
+    async def wrapper(self, route, *args, **kwargs):
+        # Labelled with the route's path before the IDs are filled in, so every channel shares one histogram
+        with metrics.timer("discord_http_seconds", route = f"{route.method} {route.path}"):
+            return await method(self, route, *args, **kwargs)
+    return wrapper
+
+def timed_callback(method):
+    async def wrapper(self, item, interaction):
+        interaction.extras["view"] = type(self).__name__ # So the response gets put down to the view
+        with metrics.timer("view_callback_seconds", view = type(self).__name__, item = callback_name(item)):
+            return await method(self, item, interaction)
+    return wrapper
+
+PATCHES = [(discord.InteractionResponse, method, first_response) for method in ("defer", "send_message", "edit_message", "send_modal", "pong")] + [
+    # Interaction responses and followups go through the webhook adapter, everything else through HTTPClient
+    (discord.http.HTTPClient, "request", timed_request),
+    (discord.webhook.async_.AsyncWebhookAdapter, "request", timed_request),
+    (ui.View, "_scheduled_task", timed_callback)
+]
+
+def open_things():
+    # How many of everything is open right now. Imported here so the games don't have to load before metrics does.
+    from sessions import manager
+    from _requestplayview import challenges
+    from edits import edits
+    from matchmaking import matchmaker
+    import persistence
+
+    sessions = manager.stats()
+    values = [("open_sessions", {"view": view}, count) for view, count in sessions["views"].items()]
+    values.append(("players_in_sessions", {}, sessions["users"]))
+    values.append(("live_games", {}, len(persistence.live)))
+    values.append(("open_challenges", {}, challenges.stats()["open"]))
+    values.append(("queued_players", {}, matchmaker.stats()["waiting"]))
+    values.extend((f"edits_{key}", {}, value) for key, value in edits.stats().items())
+    return values
+
+metrics = Metrics() # Shared by everything
@@ -0,0 +1,96 @@
+# Saves games after every move so they carry on after the bot restarts.
+# Each game is stored as a few bytes (see HEADER and the games' snapshot() methods) in the "games" namespace of the state store
+# (see statestore.py), so with an SQLite store they survive restarts and other shard processes can look them up.
+# A game's buttons have fixed custom IDs (like "connect4:3"), so when one is pressed and the game isn't in memory,
+# Rehydrate picks it up, loads the game from the store and passes the press on to the rebuilt view.
+# That means finished-with views can also be dropped from memory with evict() and brought back when they're next used.
+
+import struct
+import discord
+from discord import ui, Interaction
+import statestore
+
+CONNECT4, TICTACTOE = 1, 2 # What kind of game a snapshot is
+HEADER = struct.Struct("<BBQQ") # Kind, which player is the bot (0 for neither), player 1's ID, player 2's ID
+MAX_AGE = 24 * 60 * 60 # Forget games nobody has touched in a day
+
+live = {} # Message ID: the view for every saved game that's in memory
+restorers = {} # Kind: function that rebuilds a view from (players, bot player, state), added by each game's module
+
+def encode(kind: int, players: list, bot_player, state: bytes):
+    bot_slot = players.index(bot_player) + 1 if bot_player in players else 0
+    return HEADER.pack(kind, bot_slot, players[0].id, players[1].id) + state
+
+async def save(view: ui.View, message: discord.Message, kind: int, players: list, bot_player, state: bytes):
+    # Save a game that's still going, or forget it if it's over
+    if view.is_finished():
+        await forget(message.id)
+        return
+
+    live[message.id] = view
+    await statestore.store.set("games", str(message.id), encode(kind, players, bot_player, state), ttl = MAX_AGE)
+
+async def forget(message_id: int):
+    live.pop(message_id, None)
+    await statestore.store.delete("games", str(message_id))
+
+def evict(message_id: int):
+    # Drop a game from memory. It's already saved, so the next button press brings it back.
+    view = live.pop(message_id, None)
+    if view:
+        view.evicted = True # So whatever is waiting on the view knows the game isn't over
+        view.stop()
+
+async def restore(interaction: Interaction):
+    # Rebuild the game on the interaction's message from the store, or return None if there isn't one
+    if not interaction.guild:
+        return
+
+    state = await statestore.store.get("games", str(interaction.message.id))
+    if state is None:
+        return
+
+    kind, bot_slot, *ids = HEADER.unpack_from(state)
+    players = []
+    for member_id in ids:
+        member = interaction.guild.get_member(member_id)
+        if member is None:
+            try:
+                member = await interaction.guild.fetch_member(member_id)
+            except discord.NotFound: # They left the server, so the game can't carry on
+                await forget(interaction.message.id)
+                return
+        players.append(member)
+
+    bot_player = players[bot_slot - 1] if bot_slot else None
+    view = await restorers[kind](players, bot_player, state[HEADER.size:], interaction.message)
+
+    live[interaction.message.id] = view
+    interaction.client.add_view(view, message_id = interaction.message.id) # Route the rest of the game's presses straight to it
+    return view
+
+class Rehydrate(ui.DynamicItem[ui.Button], template = r"(?P<game>connect4|tictactoe):(?P<button>\w+)"):
+    # discord.py tries this for every game button, as well as the view the button belongs to (if it's in memory)
+    def __init__(self, custom_id: str):
+        super().__init__(ui.Button(custom_id = custom_id))
+
+    @classmethod
+    async def from_custom_id(cls, interaction: Interaction, item: ui.Button, match):
+        return cls(item.custom_id)
+
+    async def callback(self, interaction: Interaction):
+        if interaction.message.id in live: # The game's own view is handling this press
+            return
+
+        view = await restore(interaction)
+        if view is None:
+            await interaction.response.send_message("This game has ended.", ephemeral = True)
+            return
+
+        # Press the same button on the rebuilt view
+        item = [child for child in view.children if child.custom_id == self.item.custom_id][0]
+        await view._scheduled_task(item, interaction)
+
+async def setup(bot):
+    # Called by each game cog when it loads
+    bot.add_dynamic_items(Rehydrate)
@@ -0,0 +1,154 @@
+# Finds the callbacks that hold up the event loop. Call profiling.install(bot) in setup_hook next to metrics.install(bot),
+# and it stays off unless PROFILE_CALLBACKS is set.
+# Every button press and slash command is run one step at a time, where a step is everything it does between two awaits.
+# Nothing else on the shard can run during a step, so any step longer than PROFILE_SLOW_MS (default 50) gets logged and
+# counted in metrics.py's slow_callback_steps_total.
+#     PROFILE_CALLBACKS=timing   only time the steps, which costs next to nothing
+#     PROFILE_CALLBACKS=cprofile also run cProfile during the steps (not while waiting), and write each callback's profile
+#                                to PROFILE_DIR/<callback>.prof every DUMP_INTERVAL seconds, to open with pstats or snakeviz
+
+import asyncio, cProfile, hooks, logging, os, pstats, time
+from discord import app_commands, ui
+from metrics import metrics, callback_name
+
+log = logging.getLogger(__name__)
+DUMP_INTERVAL = 60
+
+class CallbackProfile:
+    # Everything recorded about one callback
+    __slots__ = ("calls", "steps", "slow", "longest", "profile")
+
+    def __init__(self, use_cprofile: bool):
+        self.calls = 0
+        self.steps = 0
+        self.slow = 0 # Steps longer than the threshold
+        self.longest = 0.0 # The longest step, in seconds
+        self.profile = cProfile.Profile() if use_cprofile else None
+
+class Profiler:
+    def __init__(self, threshold: float = 0.05, use_cprofile: bool = False, directory: str = "profiles"):
+        self.threshold = threshold # Seconds a step can take before it counts as slow
+        self.use_cprofile = use_cprofile
+        self.directory = directory
+        self.callbacks = {} # Name: CallbackProfile
+        self.stepping = False # If a step is being timed right now, so callbacks called inside it aren't timed twice
+        self.task = None # Writing the profiles out
+
+    def run(self, name: str, coro):
+        callback = self.callbacks.get(name)
+        if callback is None:
+            callback = self.callbacks[name] = CallbackProfile(self.use_cprofile)
+        callback.calls += 1
+        return Stepped(self, name, callback, coro)
+
+    def step(self, name: str, callback: CallbackProfile, seconds: float):
+        callback.steps += 1
+        callback.longest = max(callback.longest, seconds)
+        if seconds > self.threshold:
+            callback.slow += 1
+            metrics.increment("slow_callback_steps_total", callback = name)
+            log.warning("%s held the event loop for %.0fms without awaiting", name, seconds * 1000)
+
+    def dump(self):
+        # Write every callback's profile so far
+        os.makedirs(self.directory, exist_ok = True)
+        for name, callback in self.callbacks.items():
+            if callback.profile is not None and callback.steps:
+                file_name = name.strip("/").replace("/", "_").replace(" ", "_").replace(".", "_") + ".prof"
+                pstats.Stats(callback.profile).dump_stats(os.path.join(self.directory, file_name))
+
+    async def dump_loop(self):
+        while True:
+            await asyncio.sleep(DUMP_INTERVAL)
+            self.dump()
+
+    def report(self):
+        # [(name, calls, steps, slow steps, longest step in seconds)], worst first
+        rows = [(name, c.calls, c.steps, c.slow, c.longest) for name, c in self.callbacks.items()]
+        return sorted(rows, key = lambda row: row[4], reverse = True)
+
+class Stepped:
+    # Runs a coroutine for the profiler, timing (and profiling) each step it takes
+    def __init__(self, profiler: Profiler, name: str, callback: CallbackProfile, coro):
+        self.profiler = profiler
+        self.name = name
+        self.callback = callback
+        self.coro = coro
+
+    def __await__(self):
+        profiler, coro = self.profiler, self.coro
+        value, error = None, None
+
+        while True:
+            outer = not profiler.stepping # Only the outermost callback times the step
+            if outer:
+                profiler.stepping = True
+                if self.callback.profile is not None:
+                    self.callback.profile.enable()
+                start = time.perf_counter()
+
+            try:
+                if error is not None:
+                    waiting_on = coro.throw(error)
+                else:
+                    waiting_on = coro.send(value)
+            except StopIteration as finished:
+                return finished.value
+            finally:
+                if outer:
+                    elapsed = time.perf_counter() - start
+                    if self.callback.profile is not None:
+                        self.callback.profile.disable()
+                    profiler.stepping = False
+                    profiler.step(self.name, self.callback, elapsed)
+
+            try:
+                value, error = (yield waiting_on), None # Give the event loop whatever the callback is waiting on
+            except BaseException as thrown: # Like a CancelledError, pass it on to the callback
+                value, error = None, thrown
+
+profiler = None # Set by install()
+ORDER = 10 # Outside metrics.py's wrappers (see hooks.py), so view_callback_seconds doesn't count cProfile's overhead
+
+# These have to stay coroutine functions, because discord.py passes what they return to asyncio.create_task()
+def profiled_task(scheduled_task):
+    async def wrapper(self, item, interaction):
+        return await profiler.run(f"{type(self).__name__}.{callback_name(item)}", scheduled_task(self, item, interaction))
+    return wrapper
+
+def profiled_call(do_call):
+    async def wrapper(self, interaction, params):
+        return await profiler.run("/" + self.qualified_name, do_call(self, interaction, params))
+    return wrapper
+
+PATCHES = [(ui.View, "_scheduled_task", profiled_task), (app_commands.Command, "_do_call", profiled_call)]
+
+def install(bot, mode: str = None, threshold_ms: float = None, directory: str = None):
+    # Start profiling every view callback and slash command, if it's turned on. Safe to call more than once.
+    global profiler
+    mode = mode or os.environ.get("PROFILE_CALLBACKS")
+    if profiler is not None or not mode:
+        return profiler
+
+    threshold_ms = threshold_ms if threshold_ms is not None else float(os.environ.get("PROFILE_SLOW_MS", 50))
+    profiler = Profiler(threshold_ms / 1000, mode == "cprofile", directory or os.environ.get("PROFILE_DIR", "profiles"))
+
+    for owner, name, wrapper in PATCHES:
+        hooks.wrap(owner, name, "profiling", wrapper, order = ORDER)
+
+    if profiler.use_cprofile:
+        profiler.task = asyncio.get_running_loop().create_task(profiler.dump_loop())
+    return profiler
+
+def uninstall():
+    # Stop profiling and put discord.py back how it was, writing out the profiles one last time
+    global profiler
+    if profiler is None:
+        return
+
+    for owner, name, _ in PATCHES:
+        hooks.unwrap(owner, name, "profiling")
+    if profiler.task:
+        profiler.task.cancel()
+        profiler.dump()
+    profiler = None
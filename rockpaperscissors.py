@@ -1,7 +1,41 @@
 import discord
 from discord import app_commands, ui, Interaction, ButtonStyle as BS, Button
 from discord.ext import commands
-from _requestplayview import RequestToPlayView
+from _requestplayview import RequestToPlayView, challenges
+from sessions import SessionView
+from embeds import EmbedTemplate
+
+OPTIONS = (("rock", "🪨"), ("paper", "📄"), ("scissors", "✂️")) # Each move and its emoji
+CODES = {option: code for code, (option, _) in enumerate(OPTIONS)} # Moves are kept as numbers: 0 rock, 1 paper, 2 scissors
+
+BEATS = (
+    (False, False, True), # Rock beats scissors
+    (True, False, False), # Paper beats rock
+    (False, True, False) # Scissors beats paper
+)
+# The move that wins a round, looked up by which moves were played in it (one bit for each move), or None for a draw.
+# Someone only wins when exactly two different moves were played. If everyone played the same thing, or all three got played, it's a draw.
+WINNING_MOVE = tuple(
+    next((a for a in range(3) for b in range(3) if played == 1 << a | 1 << b and BEATS[a][b]), None)
+    for played in range(8)
+)
+
+# The status embeds, where only the mentions and scores change (see embeds.py)
+ROUND_EMBED = EmbedTemplate("Rock Paper Scissors", 0xc3b1e1) # Gets the round number added to the title in a best of N
+TIMEOUT_EMBED = EmbedTemplate("⏰  **Timed out!**", 0xff9691)
+DRAW_EMBED = EmbedTemplate("Draw! <:pain:1203002986331242536>", discord.Color.green())
+WIN_EMBED = EmbedTemplate("Winner! :trophy:", 0xfffaa0)
+UPSET_EMBED = EmbedTemplate("Winner! <:holymoly:1205945639435903106>", 0xfffaa0) # When the person who was challenged wins
+FFA_DRAW_EMBED = EmbedTemplate("Draw! <:pain:1203002986331242536>", 0xfffaa0)
+
+def round_winners(choices: dict):
+    # Everyone who played the winning move, however many people are playing
+    played = 0
+    for code in choices.values():
+        played |= 1 << code
+
+    winning_move = WINNING_MOVE[played]
+    return [player for player, code in choices.items() if code == winning_move]
 
 class RockPaperScissorsButton(ui.Button):
     def __init__(self, option: str, emoji: str):
@@ -12,25 +46,29 @@ class RockPaperScissorsButton(ui.Button):
         )
     
     async def callback(self, interaction: Interaction):
-        if interaction.user != self.view.player: # If the person pressing the buttons isn't the player
+        if interaction.user not in self.view.players: # If the person pressing the buttons isn't playing
             await interaction.response.send_message("This isn't for you.", ephemeral = True)
             return
 
-        if self.view.choice: # If they have already decided yet
+        if interaction.user in self.view.choices: # If they have already decided
             await interaction.response.send_message("You already made your choice!", ephemeral = True)
             return
         
-        self.view.choice = self.label
+        self.view.choices[interaction.user] = CODES[self.label]
         await interaction.response.send_message(f"You played **{self.label}**", ephemeral = True)
-        self.view.stop()  
 
-class RockPaperScissorsView(ui.View):
-    def __init__(self, player: discord.Member):
-        super().__init__(timeout = 20) # Set the timeout
-        self.player = player # Set the player
-        self.choice = None # Reset the choice made
+        if len(self.view.choices) == len(self.view.players): # Stop as soon as everyone has chosen
+            self.view.stop()
+
+class RockPaperScissorsView(SessionView):
+    # Both players pick their moves at the same time, in secret
+    def __init__(self, *players: discord.Member, skippable: bool = False):
+        super().__init__(*players, timeout = 20) # Everyone has to choose before the same deadline
+        self.players = players # Set the players
+        self.choices = {} # Each player's choice, once they've made it
+        self.skippable = skippable # If the round can go ahead without the people who didn't choose
 
-        for option, emoji in range(3): # Add the option buttons
+        for option, emoji in OPTIONS: # Add the option buttons
             self.add_item(RockPaperScissorsButton(option, emoji))
 
     async def on_callback(self):
@@ -40,13 +78,14 @@ class RockPaperScissorsView(ui.View):
 
     async def on_timeout(self):
         await self.on_callback()
+        if self.skippable: # The round is played without them, so there's nothing to announce
+            return
+
+        slow = " and ".join(player.mention for player in self.players if player not in self.choices) # Whoever didn't choose in time
         # Timeout message
         await self.message.edit(
-            content = None, view = self, embed = discord.Embed(
-                title = "⏰  **Timed out!**",
-                description = f"How hard is it to press a few buttons, {self.player.mention}?",
-                color = 0xff9691
-            )
+            content = None, view = self,
+            embed = TIMEOUT_EMBED.render(f"How hard is it to press a few buttons, {slow}?")
         )
 
 class RockPaperScissors(commands.Cog):
@@ -55,7 +94,8 @@ class RockPaperScissors(commands.Cog):
     
     @app_commands.command(name = "rockpaperscissors", description = "Play Rock Paper Scissors with another user. Have fun!")
     @commands.cooldown(1, 30, commands.BucketType.user)
-    async def rps(self, interaction: Interaction, opponent: discord.Member = None):
+    @app_commands.describe(rounds = "Play a best of this many rounds")
+    async def rps(self, interaction: Interaction, opponent: discord.Member = None, rounds: app_commands.Range[int, 1, 9] = 1):
         if not opponent or opponent == interaction.user: # If there's no opponent or the opponent is the person running the command
             await interaction.response.send_message("You can't play with yourself. Go touch grass and find some new friends! :park:", ephemeral = True)
             return
@@ -64,7 +104,17 @@ class RockPaperScissors(commands.Cog):
             await interaction.response.send_message("My maker didn't give me arms to play  :x:", ephemeral = True)
             return
         
-        view = RequestToPlayView(interaction.user, opponent, game = "Rock Paper Scissors") # Setup the request to play view
+        view = RequestToPlayView(interaction.user, opponent, game = "Rock Paper Scissors", guild_id = interaction.guild_id) # Setup the request to play view
+
+        if not await challenges.open(view): # If they have too many challenges open already
+            await interaction.response.send_message(
+                ephemeral = True,
+                embed = discord.Embed(
+                    description = f"You already have {challenges.limit} challenges open! Wait for someone to answer one first.",
+                    color = discord.Color.red()
+                )
+            )
+            return
 
         requestToPlay = discord.Embed(
             title = ":mag: Someone wants to play a game of Rock Paper Scissors!",
@@ -86,87 +136,146 @@ class RockPaperScissors(commands.Cog):
 
         await view.message.delete()
 
-        rpsview1 = RockPaperScissorsView(interaction.user) # Setup the player's view
-        
-        # Send the game message
-        await interaction.response.send_message(
-            view = rpsview1, embed = discord.Embed(
-                title = "Rock Paper Scissors",
-                description = f"""{interaction.user.mention}  \❌\n{opponent.mention}  \❌\n\n{interaction.user.mention}, make your move!""",
-                color = 0xc3b1e1
-            )
-        )
-        rpsview1.message = await interaction.original_response() # Get the message attribute
-        await rpsview1.wait() # Wait for a response
+        result = await self.play_rounds(interaction, [interaction.user, opponent], rounds)
 
-        if not rpsview1.choice: # If they don't respond, return
+        if not result: # If someone didn't respond, return
             return
 
-        p = rpsview1.choice # Register their choice
+        rpsview, scores = result
+        await rpsview.on_callback() # Disable the buttons on the view
 
-        rpsview2 = RockPaperScissorsView(opponent) # Setup the opponent's view
-        
-        # Update the message with the new view
-        await rpsview1.message.edit(
-            view = rpsview2, embed = discord.Embed(
-                title = "Rock Paper Scissors",
-                description = f"""{interaction.user.mention}  \✅\n{opponent.mention}  \❌\n\n{opponent.mention}, make your move!""",
-                color = 0xc3b1e1
-            )
-        )
-            
-        await rpsview2.wait() # Wait for the opponent's response
+        if rounds > 1: # Announce who won the best of N
+            winner = max(scores, key = scores.get)
+            await rpsview.message.edit(
+                embed = WIN_EMBED.render(f"""{self.scoreboard(scores, rpsview.choices)}
 
-        if not rpsview2.choice: # If they don't respond, return
+                                      {winner.mention} won the best of {rounds} and got some XP! <a:xp:1206668715710742568>"""),
+                view = rpsview
+            )
             return
 
-        o = rpsview2.choice
+        p = OPTIONS[rpsview.choices[interaction.user]][0] # Register their choices
+        o = OPTIONS[rpsview.choices[opponent]][0]
+        winners = round_winners(rpsview.choices)
 
-        if p == o: # If it's a draw
+        if not winners: # If it's a draw
             win = 0
-        elif p == "rock" and o == "scissors" or p == "paper" and o == "rock" or p == "scissors" and o == "paper": # If player wins
+        elif winners == [interaction.user]: # If player wins
             win = 1
-        elif p == "rock" and o == "paper" or p == "paper" and o == "scissors" or p == "scissors" and o == "rock": # If opponent wins
+        else: # If opponent wins
             win = 2
         
-        await rpsview1.on_callback() # Disable the buttons on the view
-
         if win == 0: # Announce the draw
-            await rpsview1.message.edit(
-                embed = discord.Embed(
-                    title = "Draw! <:pain:1203002986331242536>",
-                    description = f"""{interaction.user.mention}:  \✅
+            await rpsview.message.edit(
+                embed = DRAW_EMBED.render(f"""{interaction.user.mention}:  \✅
                                       {opponent.mention}:  \✅
                                       
-                                      Looks like a draw! {interaction.user.mention} :handshake: {opponent.mention}""",
-                        color = discord.Color.green()
-                ), view = rpsview2
+                                      Looks like a draw! {interaction.user.mention} :handshake: {opponent.mention}"""),
+                view = rpsview
             )
             return
 
         if win == 1: # Announce the player won
-            await rpsview1.message.edit(
-                embed = discord.Embed(
-                    title = "Winner! :trophy:",
-                    description = f"""{interaction.user.mention}  \✅
+            await rpsview.message.edit(
+                embed = WIN_EMBED.render(f"""{interaction.user.mention}  \✅
                                       {opponent.mention}  \✅
 
-                                      {interaction.user.mention} won with **{p}** and got some XP! <a:xp:1206668715710742568>""",
-                    color = 0xfffaa0
-                ), view = rpsview2
+                                      {interaction.user.mention} won with **{p}** and got some XP! <a:xp:1206668715710742568>"""),
+                view = rpsview
             )
             
         if win == 2: # Announce the opponent won
-            await rpsview1.message.edit(
-                embed = discord.Embed(
-                    title = "Winner! <:holymoly:1205945639435903106>",
-                    description = f"""{interaction.user.mention}  \✅
+            await rpsview.message.edit(
+                embed = UPSET_EMBED.render(f"""{interaction.user.mention}  \✅
                                       {opponent.mention}  \✅
                                   
-                                      {opponent.mention} won with **{o}** and got some XP! <a:xp:1206668715710742568>""",
-                    color = 0xfffaa0
-                ), view = rpsview2
+                                      {opponent.mention} won with **{o}** and got some XP! <a:xp:1206668715710742568>"""),
+                view = rpsview
             )
 
+    def scoreboard(self, scores: dict, choices: dict):
+        # One line for each player: what they played last round and how many rounds they've won
+        lines = []
+        for player, score in scores.items():
+            move = OPTIONS[choices[player]][1] if player in choices else "\\➖"
+            lines.append(f"{player.mention}  {move}  **{score}**")
+        return "\n".join(lines)
+
+    async def play_rounds(self, interaction: Interaction, players: list, rounds: int):
+        # Play rounds in one message until the game is over, and return the last round's view and everyone's scores.
+        # With 2 players that's when someone has won most of the rounds (draws are played again), otherwise it's after `rounds` rounds.
+        # Each round's result and the next round's buttons go out in the same edit.
+        free_for_all = len(players) > 2
+        scores = dict.fromkeys(players, 0)
+        description = "Make your moves! Nobody can see what you picked until everyone has."
+        message = None
+        round_number = 0
+
+        while True:
+            round_number += 1
+            view = RockPaperScissorsView(*players, skippable = free_for_all)
+            embed = ROUND_EMBED.render(description, title = f"Rock Paper Scissors - Round {round_number}" if rounds > 1 else None)
+
+            if message is None: # Send the game message
+                message = await interaction.followup.send(embed = embed, view = view, wait = True)
+            else:
+                await message.edit(embed = embed, view = view)
+
+            view.message = message
+            await view.wait() # Wait for everyone to choose, or for the time to run out
+
+            if not free_for_all and len(view.choices) < len(players): # Someone didn't respond
+                return
+
+            winners = round_winners(view.choices)
+            for winner in winners:
+                scores[winner] += 1
+
+            if rounds == 1 and not free_for_all: # A single game can end in a draw
+                return view, scores
+            if free_for_all and round_number == rounds:
+                return view, scores
+            if not free_for_all and max(scores.values()) > rounds // 2:
+                return view, scores
+
+            result = " and ".join(winner.mention for winner in winners) + " won that round!" if winners else "That round was a draw!"
+            description = f"{self.scoreboard(scores, view.choices)}\n\n{result} Make your next moves."
+
+    @app_commands.command(name = "rockpaperscissors-ffa", description = "Play Rock Paper Scissors with up to 7 other users at once. Have fun!")
+    @app_commands.describe(rounds = "How many rounds to play")
+    @commands.cooldown(1, 30, commands.BucketType.user)
+    async def rps_ffa(
+        self, interaction: Interaction,
+        player2: discord.Member, player3: discord.Member = None, player4: discord.Member = None, player5: discord.Member = None,
+        player6: discord.Member = None, player7: discord.Member = None, player8: discord.Member = None,
+        rounds: app_commands.Range[int, 1, 9] = 3
+    ):
+        # Everyone mentioned plays, without anyone needing to be asked. Nobody can be in it twice, and bots can't play.
+        players = list(dict.fromkeys(
+            player for player in (interaction.user, player2, player3, player4, player5, player6, player7, player8)
+            if player and not player.bot
+        ))
+
+        if len(players) < 2:
+            await interaction.response.send_message("You can't play with yourself. Go touch grass and find some new friends! :park:", ephemeral = True)
+            return
+        if len(players) < 3: # Two people play /rockpaperscissors, which asks the other person first
+            await interaction.response.send_message("A free-for-all needs at least 3 people. Use /rockpaperscissors to play one person!", ephemeral = True)
+            return
+
+        await interaction.response.defer() # The game is sent as a followup
+        rpsview, scores = await self.play_rounds(interaction, players, rounds)
+        await rpsview.on_callback() # Disable the buttons on the view
+
+        best = max(scores.values())
+        winners = [player for player, score in scores.items() if score == best and best > 0]
+
+        await rpsview.message.edit(
+            embed = (WIN_EMBED if winners else FFA_DRAW_EMBED).render(self.scoreboard(scores, rpsview.choices) + "\n\n" + (
+                f"{' and '.join(winner.mention for winner in winners)} won and got some XP! <a:xp:1206668715710742568>"
+                if winners else "Nobody won a single round!"
+            )), view = rpsview
+        )
+
 async def setup(bot):
     await bot.add_cog(RockPaperScissors(bot))
@@ -0,0 +1,162 @@
+# Keeps track of every game and challenge that's running, and times them all out from one place.
+# Normally discord.py gives every view with a timeout its own task, so thousands of games means thousands of timers.
+# Views that inherit from SessionView are timed by a single hashed timer wheel instead: a ring of buckets that each
+# cover `tick` seconds, where one task moves round the ring and times out whatever is due in the bucket it reaches.
+
+import asyncio, math
+from discord import ui
+
+class Session:
+    __slots__ = ("id", "view", "users", "timeout", "deadline", "bucket")
+
+    def __init__(self, id: int, view: ui.View, users: tuple, timeout: float):
+        self.id = id
+        self.view = view
+        self.users = users # The IDs of the users in the game
+        self.timeout = timeout # Seconds without an interaction before the view times out, or None to never time out
+        self.deadline = None
+        self.bucket = None # Which bucket of the wheel it's in
+
+class TimerWheel:
+    def __init__(self, tick: float = 1.0, size: int = 256):
+        self.tick = tick
+        self.buckets = [set() for _ in range(size)]
+        self.position = None # The next tick to time out, counting from when the loop started
+
+    def schedule(self, session: Session, now: float):
+        self.cancel(session)
+        if session.timeout is None:
+            return
+
+        session.deadline = now + session.timeout
+        # The first tick that ends at or after the deadline, so it's due by the time the wheel reaches its bucket.
+        # Anything due more than a full turn away stays in its bucket until the wheel comes round again
+        tick = max(math.ceil(session.deadline / self.tick), self.position or 0)
+        session.bucket = self.buckets[tick % len(self.buckets)]
+        session.bucket.add(session)
+
+    def cancel(self, session: Session):
+        if session.bucket is not None:
+            session.bucket.discard(session)
+            session.bucket = None
+
+    def advance(self, now: float):
+        # Move the wheel up to `now` and return everything that timed out on the way
+        current = int(now / self.tick)
+        if self.position is None:
+            self.position = current
+
+        expired = []
+        while self.position <= current:
+            bucket = self.buckets[self.position % len(self.buckets)]
+            for session in [session for session in bucket if session.deadline <= now]:
+                bucket.discard(session)
+                session.bucket = None
+                expired.append(session)
+            self.position += 1
+
+        return expired
+
+class SessionManager:
+    def __init__(self, tick: float = 1.0, size: int = 256):
+        self.wheel = TimerWheel(tick, size)
+        self.sessions = {} # Session ID: session
+        self.by_user = {} # User ID: {session, ...}
+        self.next_id = 0
+        self.task = None
+
+    def open(self, view: ui.View, users: tuple, timeout: float):
+        self.next_id += 1
+        session = Session(self.next_id, view, tuple(user.id for user in users), timeout)
+        self.sessions[session.id] = session
+
+        for user in session.users:
+            self.by_user.setdefault(user, set()).add(session)
+
+        loop = asyncio.get_running_loop()
+        self.wheel.schedule(session, loop.time())
+
+        if self.task is None or self.task.done(): # Start the wheel turning if nothing's running
+            self.task = loop.create_task(self.run())
+
+        return session
+
+    def touch(self, session: Session, timeout: float = ...):
+        # Someone used the view, so push the timeout back (and change it, if a new one is given)
+        if session.id not in self.sessions:
+            return
+        if timeout is not ...:
+            session.timeout = timeout
+        self.wheel.schedule(session, asyncio.get_running_loop().time())
+
+    def close(self, session: Session):
+        if self.sessions.pop(session.id, None) is None: # Already closed
+            return
+
+        self.wheel.cancel(session)
+        for user in session.users:
+            games = self.by_user[user]
+            games.discard(session)
+            if not games:
+                del self.by_user[user]
+
+    def active(self, user_id: int):
+        # Every view a user is in right now
+        return [session.view for session in self.by_user.get(user_id, ())]
+
+    def stats(self):
+        counts = {}
+        for session in self.sessions.values():
+            name = type(session.view).__name__
+            counts[name] = counts.get(name, 0) + 1
+
+        return {"sessions": len(self.sessions), "users": len(self.by_user), "views": counts}
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.wheel.position = None
+
+        while self.sessions:
+            await asyncio.sleep(self.wheel.tick)
+
+            for session in self.wheel.advance(loop.time()):
+                self.close(session)
+                # The same thing discord.py does when a view times out: finish view.wait(), stop listening and call on_timeout()
+                session.view._dispatch_timeout()
+
+manager = SessionManager() # Shared by every game
+
+class SessionView(ui.View):
+    # Use instead of ui.View to have the session manager time the view out.
+    # Setting view.timeout still works the same, it just changes the session's timeout.
+    def __init__(self, *users, timeout: float = 180):
+        self.session = None
+        super().__init__(timeout = None) # So discord.py doesn't start its own timer
+        self.session = manager.open(self, users, timeout)
+
+    @property
+    def timeout(self):
+        return None # discord.py checks this to decide whether to time the view itself
+
+    @timeout.setter
+    def timeout(self, value):
+        if self.session is not None:
+            manager.touch(self.session, value)
+
+    async def interaction_check(self, interaction):
+        manager.touch(self.session) # Every interaction resets the timeout, like it does for normal views
+        return True
+
+    def stop(self):
+        manager.close(self.session)
+        super().stop()
+
+    def timed_out(self):
+        # Called as the view times out, before anything waiting on view.wait() carries on (on_timeout() only runs after).
+        # Override it to record how the game ended, like who ran away.
+        pass
+
+    def _dispatch_timeout(self):
+        if not self.is_finished():
+            self.timed_out()
+        super()._dispatch_timeout()
@@ -0,0 +1,160 @@
+# Where the games, lobbies and challenges keep the state other processes might need to see.
+# Everything is stored as bytes under a namespace and a string key, optionally expiring after `ttl` seconds.
+# By default it's all kept in this process (MemoryStore). To share it between shard processes on the same machine, set
+# GAME_STATE_DB to the path of an SQLite file, which every process opens in WAL mode (so reads never wait for writes).
+
+import asqlite, bisect, os, time
+from metrics import metrics
+
+class StateStore:
+    # What every backend has to do. Keys are strings, values are bytes.
+    async def get(self, namespace: str, key: str):
+        raise NotImplementedError
+
+    async def set(self, namespace: str, key: str, value: bytes, ttl: float = None):
+        raise NotImplementedError
+
+    async def add(self, namespace: str, key: str, value: bytes, ttl: float = None):
+        # Set the key only if it isn't already set, and return whether it was. Use it to claim something between processes.
+        raise NotImplementedError
+
+    async def delete(self, namespace: str, key: str):
+        raise NotImplementedError
+
+    async def items(self, namespace: str, prefix: str = ""):
+        # Every key in the namespace that starts with `prefix`, and its value
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+class MemoryStore(StateStore):
+    def __init__(self):
+        self.namespaces = {} # Namespace: {key: (value, when it expires or None)}
+        self.ordered = {} # Namespace: its keys in order, so items() can go straight to a prefix instead of checking every key
+
+    def live(self, namespace: str):
+        entries = self.namespaces.setdefault(namespace, {})
+        return entries, time.time()
+
+    def remove(self, namespace: str, key: str):
+        if self.namespaces.get(namespace, {}).pop(key, None) is not None:
+            keys = self.ordered[namespace]
+            del keys[bisect.bisect_left(keys, key)]
+
+    async def get(self, namespace: str, key: str):
+        entries, now = self.live(namespace)
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now: # It's expired
+            self.remove(namespace, key)
+            return None
+        return entry[0]
+
+    async def set(self, namespace: str, key: str, value: bytes, ttl: float = None):
+        entries = self.namespaces.setdefault(namespace, {})
+        if key not in entries:
+            bisect.insort(self.ordered.setdefault(namespace, []), key)
+        entries[key] = (value, time.time() + ttl if ttl is not None else None)
+
+    async def add(self, namespace: str, key: str, value: bytes, ttl: float = None):
+        if await self.get(namespace, key) is not None:
+            return False
+        await self.set(namespace, key, value, ttl)
+        return True
+
+    async def delete(self, namespace: str, key: str):
+        self.remove(namespace, key)
+
+    async def items(self, namespace: str, prefix: str = ""):
+        entries, now = self.live(namespace)
+        keys = self.ordered.get(namespace, [])
+        # The same range the SQLite store reads: from the prefix up to the prefix followed by the highest character
+        matching = keys[bisect.bisect_left(keys, prefix):bisect.bisect_left(keys, prefix + "\U0010ffff")]
+
+        found = {}
+        for key in matching:
+            value, expires = entries[key]
+            if expires is not None and expires <= now: # Expired keys are only cleared out when something reads them
+                self.remove(namespace, key)
+            else:
+                found[key] = value
+        return found
+
+class SQLiteStore(StateStore):
+    def __init__(self, path: str):
+        self.path = path
+        self.pool = None # Opened on first use, because it needs the event loop
+
+    async def open(self):
+        if self.pool is None:
+            self.pool = await asqlite.create_pool(self.path, size = 4) # asqlite turns on WAL mode
+            async with self.pool.acquire() as conn:
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS state (
+                        namespace TEXT NOT NULL,
+                        key TEXT NOT NULL,
+                        value BLOB NOT NULL,
+                        expires_at REAL,
+                        PRIMARY KEY (namespace, key)
+                    ) WITHOUT ROWID
+                """)
+                await conn.execute("DELETE FROM state WHERE expires_at <= ?", (time.time(),)) # Clear out anything that's expired
+        return self.pool
+
+    async def get(self, namespace: str, key: str):
+        with metrics.timer("db_seconds", source = "statestore", query = "get"):
+            async with (await self.open()).acquire() as conn:
+                req = await conn.execute(
+                    "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                    (namespace, key, time.time())
+                )
+                row = await req.fetchone()
+            return row['value'] if row else None
+
+    async def set(self, namespace: str, key: str, value: bytes, ttl: float = None):
+        with metrics.timer("db_seconds", source = "statestore", query = "set"):
+            async with (await self.open()).acquire() as conn:
+                await conn.execute(
+                    "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (namespace, key, value, time.time() + ttl if ttl is not None else None)
+                )
+
+    async def add(self, namespace: str, key: str, value: bytes, ttl: float = None):
+        with metrics.timer("db_seconds", source = "statestore", query = "add"):
+            now = time.time()
+            async with (await self.open()).acquire() as conn:
+                # Only replaces the row that's already there if it has expired, in one statement so two processes can't both win
+                req = await conn.execute("""
+                    INSERT INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at
+                    WHERE state.expires_at <= ?
+                    RETURNING key
+                """, (namespace, key, value, now + ttl if ttl is not None else None, now))
+                row = await req.fetchone()
+            return row is not None
+
+    async def delete(self, namespace: str, key: str):
+        with metrics.timer("db_seconds", source = "statestore", query = "delete"):
+            async with (await self.open()).acquire() as conn:
+                await conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    async def items(self, namespace: str, prefix: str = ""):
+        with metrics.timer("db_seconds", source = "statestore", query = "items"):
+            async with (await self.open()).acquire() as conn:
+                # Keys sort as bytes, so everything starting with the prefix comes before the prefix followed by the highest character
+                req = await conn.execute(
+                    "SELECT key, value FROM state WHERE namespace = ? AND key >= ? AND key < ? AND (expires_at IS NULL OR expires_at > ?)",
+                    (namespace, prefix, prefix + "\U0010ffff", time.time())
+                )
+                rows = await req.fetchall()
+            return {row['key']: row['value'] for row in rows}
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+# Shared by every cog
+store = SQLiteStore(os.environ["GAME_STATE_DB"]) if os.environ.get("GAME_STATE_DB") else MemoryStore()
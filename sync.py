@@ -26,3 +26,37 @@ async def sync(ctx):
         )
     finally:
         await ctx.reply(embed = embed)
+
+
+# Needs `from metrics import metrics, DEADLINE`, and metrics.install(bot) in your setup_hook so there's something to show (see metrics.py)
+@bot.command()
+@commands.is_owner()
+async def stats(ctx):
+    def rows(name: str, label: str, limit: int = 8):
+        # One line for each of the busiest: how many, the median and 95th percentile times, and the slowest
+        lines = [
+            f"`{labels.get(label, '?')}`  {count}x  p50 {median * 1000:.0f}ms  p95 {p95 * 1000:.0f}ms  max {slowest * 1000:.0f}ms"
+            for labels, count, median, p95, slowest in metrics.summary(name)[:limit]
+        ]
+        return "\n".join(lines) or "Nothing yet"
+
+    late = sum(count for (name, _), count in metrics.counters.items() if name == "interactions_late_total")
+    gauges = {name: value for name, labels, value in metrics.gauges() if not labels}
+    sessions = sum(value for name, labels, value in metrics.gauges() if name == "open_sessions")
+
+    embed = discord.Embed(
+        title = "Stats",
+        description = f"{late} interaction(s) answered after the {DEADLINE:g} second deadline.",
+        color = discord.Color.blurple()
+    )
+    embed.add_field(name = "Time to first response", value = rows("interaction_response_seconds", "command"), inline = False)
+    embed.add_field(name = "View callbacks", value = rows("view_callback_seconds", "item"), inline = False)
+    embed.add_field(name = "Database", value = rows("db_seconds", "source", 4), inline = False)
+    embed.add_field(name = "Other APIs", value = rows("http_seconds", "api", 4), inline = False)
+    embed.add_field(name = "Discord API", value = rows("discord_http_seconds", "route", 5), inline = False)
+    embed.add_field(
+        name = "Open right now",
+        value = f"{sessions} views, {gauges['live_games']} games, {gauges['open_challenges']} challenges\n"
+                f"{gauges['edits_saved']} of {gauges['edits_requested']} message edits saved by coalescing"
+    )
+    await ctx.reply(embed = embed)
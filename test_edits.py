@@ -0,0 +1,128 @@
+# Run with: python -m pytest test_edits.py
+# Everything goes through fakes.py's pretend Discord, with short windows so the tests stay quick.
+
+import asyncio, time
+import pytest
+from edits import Bucket, EditScheduler
+from fakes import FakeHTTP, FakeChannel, FakeMessage, FakeUser, FakeInteraction
+
+def run(coro):
+    return asyncio.run(coro)
+
+def press(message: FakeMessage):
+    return FakeInteraction(FakeUser(), message)
+
+def test_edits_while_busy_merge_into_the_latest():
+    async def main():
+        http = FakeHTTP(latency = 0.02)
+        message = FakeMessage(FakeChannel(http))
+        scheduler = EditScheduler()
+
+        first = asyncio.create_task(scheduler.edit(message, content = "1"))
+        await asyncio.sleep(0.005) # The first edit is on its way now
+        await asyncio.gather(
+            first,
+            scheduler.edit(message, content = "2"),
+            scheduler.edit(message, embed = "board"),
+            scheduler.edit(message, content = "3")
+        )
+        return http, message, scheduler
+
+    http, message, scheduler = run(main())
+    assert message.state == {"content": "3", "embed": "board"}
+    assert http.requests == 2 # The first edit, then everything after it in one
+    assert (scheduler.requested, scheduler.sent, scheduler.saved) == (4, 2, 2)
+    assert not scheduler.editors
+
+def test_first_edit_answers_the_interaction_and_later_ones_defer():
+    async def main():
+        http = FakeHTTP(latency = 0.02)
+        message = FakeMessage(FakeChannel(http))
+        scheduler = EditScheduler()
+        first, second = press(message), press(message)
+
+        task = asyncio.create_task(scheduler.edit(message, first, content = "1"))
+        await asyncio.sleep(0.005) # The first edit is on its way now
+        await scheduler.edit(message, second, content = "2") # Waits behind the first, so it's answered with a defer
+        await task
+        return http, message, first, second
+
+    http, message, first, second = run(main())
+    assert first.response.is_done() and second.response.is_done()
+    assert http.responses == 2 # The first as the edit itself, the second as a defer
+    assert http.requests == 1 # Only the second edit went through the channel
+    assert message.state["content"] == "2"
+
+def test_bucket_keeps_a_channel_under_the_rate_limit():
+    async def main():
+        http = FakeHTTP(rate = 5, per = 0.3, latency = 0.001)
+        channel = FakeChannel(http)
+        scheduler = EditScheduler(rate = 5, per = 0.3)
+        messages = [FakeMessage(channel) for _ in range(12)]
+
+        start = time.monotonic()
+        await asyncio.gather(*(scheduler.edit(message, content = "x") for message in messages))
+        return http, time.monotonic() - start
+
+    http, elapsed = run(main())
+    assert http.requests == 12
+    assert http.rate_limited == 0 # The bucket held them back instead of Discord
+    assert elapsed >= 2 * 0.3 # 12 edits at 5 per window take three windows
+
+def test_bucket_delay():
+    bucket = Bucket(rate = 2, per = 1.0)
+    assert bucket.delay(10.0) == 0.0
+    bucket.sent.extend([10.0, 10.4])
+    assert bucket.delay(10.5) == pytest.approx(0.5) # Until the first one leaves the window
+    assert bucket.delay(11.0) == 0.0
+
+    bucket.block(5.0)
+    assert bucket.delay(time.monotonic()) == pytest.approx(5.0, abs = 0.1)
+
+def test_rate_limited_edits_block_the_bucket_and_retry():
+    async def main():
+        # Discord allows fewer edits than the scheduler thinks, and discord.py gives up on 429s straight away
+        http = FakeHTTP(rate = 1, per = 0.2, latency = 0.001, max_ratelimit_timeout = 0)
+        channel = FakeChannel(http)
+        scheduler = EditScheduler(rate = 5, per = 0.2)
+        messages = [FakeMessage(channel) for _ in range(3)]
+
+        await asyncio.gather(*(scheduler.edit(message, content = str(i)) for i, message in enumerate(messages)))
+        return http, messages, scheduler
+
+    http, messages, scheduler = run(main())
+    assert [message.state["content"] for message in messages] == ["0", "1", "2"]
+    assert scheduler.rate_limited >= 1 and scheduler.rate_limited == http.rate_limited
+    assert scheduler.sent == 3
+
+def test_a_failed_edit_raises_in_everyone_merged_into_it():
+    async def main():
+        http = FakeHTTP(latency = 0.02)
+        message = FakeMessage(FakeChannel(http))
+        scheduler = EditScheduler()
+        calls = 0
+
+        async def edit(**kwargs):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.02)
+            if calls == 2:
+                raise RuntimeError("Discord said no")
+            message.update(kwargs)
+        message.edit = edit
+
+        first = asyncio.create_task(scheduler.edit(message, content = "1"))
+        await asyncio.sleep(0.005) # The first edit is on its way now
+        results = await asyncio.gather(
+            first,
+            scheduler.edit(message, content = "2"),
+            scheduler.edit(message, content = "3"),
+            return_exceptions = True
+        )
+        return results, message, scheduler
+
+    results, message, scheduler = run(main())
+    assert results[0] is None # It went out before the failing one
+    assert all(isinstance(result, RuntimeError) for result in results[1:])
+    assert message.state["content"] == "1"
+    assert scheduler.sent == 1 and not scheduler.editors
@@ -0,0 +1,64 @@
+# Run with: python -m pytest test_hooks.py
+
+import asyncio
+import pytest
+from discord import app_commands, ui
+import hooks, metrics, profiling
+
+class Base:
+    def greet(self):
+        return "hi"
+
+class Child(Base):
+    pass
+
+def tag(name):
+    def wrapper(method):
+        def wrapped(self):
+            return f"{name}({method(self)})"
+        return wrapped
+    return wrapper
+
+def test_wrappers_apply_in_order_whichever_comes_first():
+    hooks.wrap(Child, "greet", "outer", tag("outer"), order = 10)
+    hooks.wrap(Child, "greet", "inner", tag("inner"))
+    assert Child().greet() == "outer(inner(hi))"
+    assert hooks.wrapped(Child, "greet") == ["inner", "outer"]
+
+    hooks.wrap(Child, "greet", "inner", tag("inner")) # Installing again doesn't wrap it twice
+    assert Child().greet() == "outer(inner(hi))"
+
+    hooks.unwrap(Child, "greet", "outer")
+    assert Child().greet() == "inner(hi)"
+    hooks.unwrap(Child, "greet", "inner")
+    assert Child().greet() == "hi"
+    assert "greet" not in Child.__dict__ # It was Base's all along
+    assert not hooks.hooks
+
+def test_refuses_to_wrap_over_something_else():
+    hooks.wrap(Child, "greet", "ours", tag("ours"))
+    Child.greet = lambda self: "theirs"
+    try:
+        with pytest.raises(RuntimeError):
+            hooks.wrap(Child, "greet", "more", tag("more"))
+    finally:
+        del Child.greet
+        hooks.hooks.clear()
+
+def test_metrics_and_profiling_uninstall():
+    originals = ui.View._scheduled_task, app_commands.Command._do_call
+
+    async def run():
+        profiling.install(None, "timing") # Before metrics, but still goes outside it
+        metrics.metrics.install(None)
+        assert hooks.wrapped(ui.View, "_scheduled_task") == ["metrics", "profiling"]
+
+        metrics.metrics.install(None)
+        assert hooks.wrapped(ui.View, "_scheduled_task") == ["metrics", "profiling"]
+
+        metrics.metrics.uninstall()
+        profiling.uninstall()
+
+    asyncio.run(run())
+    assert (ui.View._scheduled_task, app_commands.Command._do_call) == originals
+    assert not hooks.hooks
@@ -0,0 +1,79 @@
+# Run with: python -m pytest test_sessions.py
+
+import itertools, random
+from sessions import Session, TimerWheel
+
+ids = itertools.count(1)
+
+def make_session(timeout: float):
+    return Session(next(ids), None, (), timeout)
+
+def turn(wheel: TimerWheel, start: float, until: float, step: float = None):
+    # Advance the wheel the way SessionManager.run() does, and return {session: when it timed out}
+    step = step or wheel.tick
+    fired, now = {}, start
+    while now <= until:
+        for session in wheel.advance(now):
+            fired[session] = now
+        now += step
+    return fired
+
+def test_times_out_within_a_tick_of_the_deadline():
+    rng = random.Random(14) # Seeded, so a failure can be played again
+    wheel = TimerWheel(tick = 1.0, size = 256)
+    start = 1000.3
+    wheel.advance(start)
+    sessions = [make_session(rng.uniform(1, 60)) for _ in range(1000)]
+    for session in sessions:
+        wheel.schedule(session, start + rng.uniform(0, 1))
+
+    fired = turn(wheel, start + 1, start + 120)
+    assert set(fired) == set(sessions)
+    for session, when in fired.items():
+        # Due at the end of the deadline's tick, and noticed the next time the wheel moves
+        assert session.deadline <= when <= session.deadline + 2 * wheel.tick
+
+def test_longer_than_a_turn():
+    wheel = TimerWheel(tick = 1.0, size = 8)
+    wheel.advance(0.0)
+    session = make_session(20.5)
+    wheel.schedule(session, 0.0)
+
+    assert not turn(wheel, 1.0, 20.0)
+    assert turn(wheel, 21.0, 22.0) == {session: 21.0}
+
+def test_uneven_advances():
+    # The event loop can be late, so the wheel sometimes moves several ticks at once
+    rng = random.Random(15)
+    wheel = TimerWheel(tick = 0.5, size = 16)
+    wheel.advance(0.0)
+    sessions = [make_session(rng.uniform(0.5, 20)) for _ in range(200)]
+    for session in sessions:
+        wheel.schedule(session, 0.0)
+
+    fired = turn(wheel, 0.7, 30.0, step = 1.3)
+    assert set(fired) == set(sessions)
+    for session, when in fired.items():
+        assert session.deadline <= when <= session.deadline + wheel.tick + 1.3
+
+def test_rescheduling_and_cancelling():
+    wheel = TimerWheel(tick = 1.0, size = 256)
+    wheel.advance(0.0)
+    touched, cancelled = make_session(5), make_session(5)
+    wheel.schedule(touched, 0.0)
+    wheel.schedule(cancelled, 0.0)
+
+    wheel.schedule(touched, 3.0) # Someone used the view, so it's due at 8 now
+    wheel.cancel(cancelled)
+
+    assert not turn(wheel, 1.0, 7.0)
+    assert turn(wheel, 8.0, 10.0) == {touched: 8.0}
+    assert touched.bucket is None and cancelled.bucket is None
+
+def test_no_timeout():
+    wheel = TimerWheel()
+    wheel.advance(0.0)
+    session = make_session(None)
+    wheel.schedule(session, 0.0)
+    assert session.bucket is None
+    assert not turn(wheel, 1.0, 600.0)
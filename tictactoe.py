@@ -1,15 +1,35 @@
-import discord, random
+import discord, random, functools, struct, persistence, matchmaking, lazy
 from discord import app_commands, ui, Interaction, ButtonStyle as BS
 from discord.ext import commands
 from datetime import datetime as dt, timedelta as td
 from math import ceil
-from _requestplayview import RequestToPlayView
+from _requestplayview import RequestToPlayView, challenges
+from kinarow import lines
+from sessions import SessionView
+from edits import edits
+from embeds import EmbedTemplate
+
+tictactoe_solver = lazy.module("tictactoe_solver") # Solving every position takes a moment, so it's only done once a game needs it
+
+# The board is kept as two 9 bit numbers, one for X and one for O, where bit 0 is the top left and bit 8 is the bottom right.
+CELL_BITS = (0, *(1 << cell for cell in range(9))) # The bit for each button's ID (1 to 9), so ID 0 has none
+WIN_MASKS = lines(3, 3, 3).lines # The 8 rows, columns and diagonals
+FULL = 0b111111111
+# What an X or an O board adds to the board number tictactoe_solver uses, for every possible board
+BASE3 = tuple(sum(3 ** cell for cell in range(9) if mask >> cell & 1) for mask in range(512))
+PIECE_DISPLAY = (None, '❌', '⭕') # What player 1 (X) and player 2 (O) show on the buttons
+# The end screens, where only the mentions change (see embeds.py)
+TIMEOUT_EMBED = EmbedTemplate("⏰  **Timed out!**", discord.Color.red())
+DRAW_EMBED = EmbedTemplate("Draw!", 0xc3b1e1)
+WIN_EMBED = EmbedTemplate("🏆 Winner!", discord.Color.yellow())
+SNAPSHOT = struct.Struct("<I") # snapshot() as bytes, for saving games (see persistence.py)
 
 class TicTacToeButton(ui.Button):
     def __init__(self, ID):
         super().__init__(
             label = "\u200b",
             style = BS.blurple,
+            custom_id = f"tictactoe:{ID}", # Fixed so the game can be picked back up after a restart
             row = ceil(ID / 3) - 1 # Aligh the buttons
         ) 
         self.ID = ID
@@ -17,128 +37,149 @@ class TicTacToeButton(ui.Button):
     async def callback(self, interaction: Interaction): # When the button gets clicked
         await self.view.input_move(interaction, self, self.ID) # Input the move
 
-class TicTacToeView(ui.View):
-    def __init__(self, *players):
-        super().__init__(timeout = 20) # Set the timeout
+class TicTacToeView(SessionView):
+    def __init__(self, *players, bot_player: discord.Member = None):
+        super().__init__(*players, timeout = 20) # Set the timeout
         [self.add_item(TicTacToeButton(i + 1)) for i in range(9)] # Add the buttons to the view
         self.pieces = {1: 'X', 2: 'O'} # Assign the pieces
-        self.board = [[0 for _ in range(3)] for _ in range(3)] # Create the board
-        self.players = [None] + players # buffer to use L[x] instead of L[x - 1]
+        self.masks = [0, 0] # Create the board: X's cells and O's cells
+        self.players = [None, *players] # buffer to use L[x] instead of L[x - 1]
         self.turn = random.randint(1, 2) # Randomly choose a player
+        self.bot_player = bot_player # The member the computer plays as, if there is one
+        self.winner = None # Who won, once someone has
+        self.message = None # The game's message, once it's been sent
+        self.evicted = False # If the game was dropped from memory (see persistence.py) rather than finished
 
     async def on_callback(self):
         for child in self.children:
             child.disabled = True
 
-    async def on_timeout(self):
+    def timed_out(self):
         # Get the person who's NOT playing now (the person playing now has run away from the game)
-        winner = [p for p in self.players if p and p != self.players[self.turn]][0]
+        self.winner = [p for p in self.players if p and p != self.players[self.turn]][0]
+
+    async def on_timeout(self):
+        await persistence.forget(self.message.id)
+        winner = self.winner # Set by timed_out()
         await self.on_callback() # Disable all buttons
 
         # Update the message
-        await self.message.edit(
+        await edits.edit(
+            self.message,
             content = None,
-            embed = discord.Embed(
-                title = "⏰  **Timed out!**",
-                description = f"Looks like {self.players[self.turn].mention} ran from the game, which means{winner.mention} won!",
-                color = discord.Color.red()
-            ), view = self
+            embed = TIMEOUT_EMBED.render(f"Looks like {self.players[self.turn].mention} ran from the game, which means {winner.mention} won!"),
+            view = self
         )
 
-    def rotate_90(self, matrix): # rotate 90 degrees clockwize
-        return [[matrix[-1-i][x] for i, _ in enumerate(matrix)] for x, _ in enumerate(matrix)]
-    
+    @property
+    def state(self):
+        # The board as a number, to look it up in tictactoe_solver
+        return BASE3[self.masks[0]] + 2 * BASE3[self.masks[1]]
+
+    def snapshot(self):
+        # The whole game as one number: X's cells, O's cells and whose turn it is
+        return self.masks[0] | self.masks[1] << 9 | self.turn << 18
+
+    def restore(self, snapshot):
+        self.masks = [snapshot & FULL, snapshot >> 9 & FULL]
+        self.turn = snapshot >> 18
+
+        # Put the pieces back on the buttons
+        for child in self.children:
+            for player, mask in enumerate(self.masks, start = 1):
+                if mask & CELL_BITS[child.ID]:
+                    child.label = PIECE_DISPLAY[player]
+                    child.disabled = True
+
+    async def save(self):
+        await persistence.save(self, self.message, persistence.TICTACTOE, self.players[1:], self.bot_player, SNAPSHOT.pack(self.snapshot()))
+
+    @classmethod
+    async def from_snapshot(cls, players, bot_player, state, message):
+        # Rebuild a saved game (see persistence.py)
+        view = cls(*players, bot_player = bot_player)
+        view.restore(SNAPSHOT.unpack(state)[0])
+        view.message = message
+        return view
+
     def check_for_wins(self):
-        lines = [
-            [sum(line) for line in self.board], # Check horizontally for a win
-            [sum(line) for line in self.rotate_90(self.board)], # Check vertically for a win by rotating the board
-            [
-                sum(self.board[x][x] for x in range(3)), # Check the up-right diagonal
-                sum(self.board[2-x][x] for x in range(3)) # Check the down-right diagonal
-            ]
-        ]
-
-        for line in lines:
-            if 3 in line: # If there's 1, 1, 1, that totals to 3, meaning player 1 has won
+        x, o = self.masks
+        for line in WIN_MASKS:
+            if x & line == line: # If X has every cell in the line, player 1 won
                 return 1
-            elif -3 in line: # If there's -1, -1, -1, that totals to -3, meaning player 2 has won
+            if o & line == line: # If O has every cell in the line, player 2 won
                 return 2
-            
-            if sum([line.count(0) for line in self.board]) == 1: # If the board is full and nobody has won
-                return 0
+        
+        if x | o == FULL: # If the board is full and nobody has won
+            return 0
     
     async def game_end_embed(self, result = None):
-        if not result or result != 0: # If there is no result (win, lose, draw), just leave
+        if result is None: # If there is no result (win, lose, draw), just leave
             return
 
         if result == 0: # If it's a draw
-            header = "Draw!"
-            desc = "To be fair, it is just a 3x3 grid."
-            colour = 0xc3b1e1
-                
-        elif result in [1, 2]: # If there is a winner
-            header = "🏆 Winner!"
-            desc = f"{self.players[result].mention} won as :{self.pieces[result].lower()}:\n(Looks like someone needs to step up their game.)",
-            colour = discord.Color.yellow()
-        
-        # Create the end screen embed
-        embed = discord.Embed(
-            title = header,
-            description = desc[0],
-            color = colour
-        )
+            return DRAW_EMBED.render("To be fair, it is just a 3x3 grid.")
 
-        return embed
+        # If there is a winner
+        return WIN_EMBED.render(f"{self.players[result].mention} won as :{self.pieces[result].lower()}:\n(Looks like someone needs to step up their game.)")
         
     async def input_move(self, interaction: Interaction, button: discord.Button, position: int):
-        piece_display = {
-            'X': '❌',
-            'O': '⭕'
-        }
-        
         if interaction.user == self.players[self.turn]:
-            button.label = piece_display[self.pieces[self.turn]]
-            button.disabled = True
-
-            if self.pieces[self.turn] == 'X':
-                piece_to_place = 1
-            if self.pieces[self.turn] == 'O':
-                piece_to_place = -1
-
-            x, y = divmod(position, 3)
-            
-            cells = [
-                (0, 0), (0, 1), (0, 2),
-                (1, 0), (1, 1), (1, 2),
-                (2, 0), (2, 1), (2, 2)
-            ]
-
-            x, y = cells[position - 1]
-            self.board[x][y] = piece_to_place
-            
-            if self.turn == 1:
-                self.turn = 2
-            else:
-                self.turn = 1
+            E = await self.place(button, position)
+
+            # If the game is still going and it's the bot's turn, it plays straight away
+            if not E and self.players[self.turn] == self.bot_player:
+                cell = tictactoe_solver.best_move(self.state, self.turn)
+                E = await self.place(self.children[cell], cell + 1)
 
-            E = await self.game_end_embed(self.check_for_wins())
             if E:
                 await self.on_callback()
-                await interaction.response.edit_message(
+                await edits.edit(
+                    interaction.message, interaction,
                     content = None,
                     embed = E, view = self
                 )
                 self.stop()
             else:
-                await interaction.response.edit_message(
+                # Moves made close together are sent as one edit (see edits.py)
+                await edits.edit(
+                    interaction.message, interaction,
                     content = self.players[self.turn].mention,
                     embed = None, view = self
                 )
 
+            await self.save() # Save the move in case the bot restarts, or forget the game if it's over
+
+    async def place(self, button: discord.Button, position: int):
+        # Put the current player's piece in a cell, and return the end screen if the game is over
+        button.label = PIECE_DISPLAY[self.turn]
+        button.disabled = True
+
+        self.masks[self.turn - 1] |= CELL_BITS[position]
+        
+        if self.turn == 1:
+            self.turn = 2
+        else:
+            self.turn = 1
+
+        result = self.check_for_wins()
+        if result: # 1 or 2, not a draw
+            self.winner = self.players[result]
+        return await self.game_end_embed(result)
+
 class TicTacToe(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
+    async def cog_load(self):
+        await persistence.setup(self.bot) # Pick games back up after a restart
+
+    async def cog_unload(self):
+        # Drop the games from memory. They're saved, so they'll come back when someone presses a button.
+        for message_id, view in list(persistence.live.items()):
+            if isinstance(view, TicTacToeView):
+                persistence.evict(message_id)
+
     @app_commands.command(name = "tictactoe", description = "Play tic-tac-toe with another user. Have fun!")
     @commands.cooldown(1, 30, commands.BucketType.user)
     async def tictactoe(self, interaction: Interaction, opponent: discord.Member = None):        
@@ -146,11 +187,29 @@ class TicTacToe(commands.Cog):
             await interaction.response.send_message("You can't play with yourself. Go touch grass and find some new friends! :park:")
             return
         
-        if opponent == self.bot: # If the opponent is the bot
-            await interaction.response.send_message("my maker didn't give me arms to play  :x:")
+        if opponent == self.bot.user: # If the opponent is the bot, it plays every game perfectly (see tictactoe_solver.py)
+            game_view = TicTacToeView(interaction.user, opponent, bot_player = opponent) # Setup the game view
+
+            if game_view.players[game_view.turn] == opponent: # If the bot goes first, play its move before sending the game
+                cell = tictactoe_solver.best_move(game_view.state, game_view.turn)
+                await game_view.place(game_view.children[cell], cell + 1)
+
+            await interaction.response.send_message(content = game_view.players[game_view.turn].mention, view = game_view) # Send the game
+            game_view.message = await interaction.original_response() # Get the message from the above interaction
+            await game_view.save()
             return
         
-        intro_view = RequestToPlayView(interaction.user, opponent, game = "Tic-Tac-Toe") # Setup the intro view
+        intro_view = RequestToPlayView(interaction.user, opponent, game = "Tic-Tac-Toe", guild_id = interaction.guild_id) # Setup the intro view
+
+        if not await challenges.open(intro_view): # If they have too many challenges open already
+            await interaction.response.send_message(
+                ephemeral = True,
+                embed = discord.Embed(
+                    description = f"You already have {challenges.limit} challenges open! Wait for someone to answer one first.",
+                    color = discord.Color.red()
+                )
+            )
+            return
         
         requestToPlay = discord.Embed(
             title = ":mag: Someone wants to play a game of Tic-Tac-Toe!",
@@ -167,10 +226,7 @@ class TicTacToe(commands.Cog):
         
         await intro_view.message.delete() # Delete the intro message
 
-        game_view = TicTacToeView(interaction.user, opponent) # Setup the game view
-
-        await interaction.followup.send(content = game_view.players[game_view.turn].mention, view = game_view) # Send the game
-        game_view.message = await interaction.original_response() # Get the message from the above interaction
+        await start_game(functools.partial(interaction.followup.send, wait = True), interaction.user, opponent)
         # No need for .wait() because there's nothing else to do after the game finishes
 
     @tictactoe.error
@@ -187,5 +243,15 @@ class TicTacToe(commands.Cog):
             raise error
 
 
+async def start_game(send, *players: discord.Member):
+    # Send a game between two people with `send` (like a followup or a thread's send). It plays itself from there.
+    game_view = TicTacToeView(*players) # Setup the game view
+    game_view.message = await send(content = game_view.players[game_view.turn].mention, view = game_view) # Send the game
+    await game_view.save()
+    return game_view
+
 async def setup(bot):
     await bot.add_cog(TicTacToe(bot))
+
+persistence.restorers[persistence.TICTACTOE] = TicTacToeView.from_snapshot
+matchmaking.games["tictactoe"] = start_game
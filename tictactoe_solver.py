@@ -0,0 +1,95 @@
+# Every tic-tac-toe position, solved.
+# A board is numbered by reading its cells (top left to bottom right) as a base 3 number, with 0 for empty, 1 for X and 2 for O.
+# That only gives 3^9 = 19683 boards, so the result and the best move for each one are worked out once and kept in small arrays.
+# Either player can go first in TicTacToeView, so the best move is stored for both X and O to play.
+
+from kinarow import lines
+
+POWERS = tuple(3 ** cell for cell in range(9)) # What a counter in each cell adds to the board's number (times 1 for X or 2 for O)
+STATES = 3 ** 9
+CELL_ORDER = (4, 0, 2, 6, 8, 1, 3, 5, 7) # The middle, then the corners, then the edges
+
+PLAYING, X_WON, O_WON, DRAW = 0, 1, 2, 3
+LOSS, TIE, WIN = 0, 1, 2 # How a move turns out for the player making it
+
+def cells(state):
+    return [state // power % 3 for power in POWERS]
+
+def solve():
+    # Returns (outcomes, moves): outcomes[state] is one of PLAYING, X_WON, O_WON or DRAW.
+    # moves[state * 2 + player - 1] has the best cell (0 to 8) in the low 4 bits and LOSS, TIE or WIN in the high bits.
+    winning_lines = lines(3, 3, 3).lines
+    outcomes = bytearray(STATES)
+    moves = bytearray(STATES * 2)
+    scores = {}
+
+    for state in range(STATES):
+        board = cells(state)
+        masks = [sum(1 << cell for cell in range(9) if board[cell] == player) for player in (1, 2)]
+
+        if any(masks[0] & line == line for line in winning_lines):
+            outcomes[state] = X_WON
+        elif any(masks[1] & line == line for line in winning_lines):
+            outcomes[state] = O_WON
+        elif 0 not in board:
+            outcomes[state] = DRAW
+
+    def score(state, player):
+        # How good the board is for `player`, who is about to move. Quicker wins and slower losses score further from 0.
+        key = state * 2 + player - 1
+        if key in scores:
+            return scores[key]
+
+        outcome = outcomes[state]
+        empty = [cell for cell in CELL_ORDER if state // POWERS[cell] % 3 == 0]
+
+        if outcome == DRAW:
+            best = 0
+        elif outcome != PLAYING: # The other player just won
+            best = -(len(empty) + 1)
+        else:
+            best, best_cell = None, None
+            for cell in empty:
+                result = -score(state + player * POWERS[cell], 3 - player)
+                if best is None or result > best:
+                    best, best_cell = result, cell
+
+            moves[key] = best_cell | ((WIN if best > 0 else TIE if best == 0 else LOSS) << 4)
+
+        scores[key] = best
+        return best
+
+    for state in range(STATES):
+        if outcomes[state] == PLAYING:
+            for player in (1, 2):
+                score(state, player)
+
+    return outcomes, moves
+
+OUTCOMES, MOVES = solve()
+
+def state_number(board, pieces = (1, -1)):
+    # Work out the number of a list-of-lists board, where `pieces` is what X and O's cells hold
+    state = 0
+    for cell, item in enumerate(item for line in board for item in line):
+        if item == pieces[0]:
+            state += POWERS[cell]
+        elif item == pieces[1]:
+            state += 2 * POWERS[cell]
+    return state
+
+def result(state):
+    # Same results as TicTacToeView.check_for_wins: 1 or 2 for who won, 0 for a draw, or None if it's still going
+    outcome = OUTCOMES[state]
+    if outcome == DRAW:
+        return 0
+    if outcome != PLAYING:
+        return outcome
+
+def best_move(state, player):
+    # The best cell (0 to 8) for player 1 (X) or player 2 (O) to play in
+    return MOVES[state * 2 + player - 1] & 0xf
+
+def expected(state, player):
+    # LOSS, TIE or WIN: how the game ends for `player` if both sides play perfectly from here
+    return MOVES[state * 2 + player - 1] >> 4
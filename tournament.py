@@ -0,0 +1,155 @@
+# Turns a lobby into a tournament once it closes (see /lobby create's game option).
+# Every round's matches are played at the same time, each in its own thread so they don't all share the channel's rate
+# limits, and once they've all finished the results and the next round's matches go out together in one message.
+# Single elimination halves the field every round, so 64 players take 6 rounds. Round robin has everyone play everyone
+# once, so it's only offered up to ROUND_ROBIN_LIMIT players and bigger lobbies play elimination instead.
+
+import asyncio, logging, random
+import discord
+import matchmaking
+
+log = logging.getLogger(__name__)
+
+ELIMINATION, ROUND_ROBIN = "elimination", "roundrobin"
+ROUND_ROBIN_LIMIT = 16
+REPLAYS = 2 # Times a drawn knockout match is played again before the higher seed goes through
+UNPLAYED = object() # What play_match() returns when the game couldn't be played, which isn't a draw or a win for anyone
+MAX_DESCRIPTION = 4000 # Discord allows 4096 characters in an embed's description
+
+class Tournament:
+    def __init__(self, interaction: discord.Interaction, game: str, players: list, mode: str = ELIMINATION):
+        self.channel = interaction.channel # Where the lobby was. Not followups, because those stop working after 15 minutes
+        self.game = game
+        self.players = list(players)
+        random.shuffle(self.players) # The seeding, best first
+        self.mode = ROUND_ROBIN if mode == ROUND_ROBIN and len(self.players) <= ROUND_ROBIN_LIMIT else ELIMINATION
+        self.points = dict.fromkeys(self.players, 0.0) # Round robin scores: 1 for a win, 0.5 for a draw
+        self.round = 0
+
+    @property
+    def name(self):
+        return matchmaking.NAMES[self.game]
+
+    async def destination(self, first: discord.Member, second: discord.Member):
+        # Somewhere to send a match: a thread of its own if the channel can have them, otherwise the channel itself
+        if isinstance(self.channel, discord.TextChannel):
+            try:
+                thread = await self.channel.create_thread(
+                    name = f"Round {self.round}: {first.display_name} vs {second.display_name}",
+                    type = discord.ChannelType.public_thread, auto_archive_duration = 60
+                )
+                return thread.send
+            except discord.HTTPException as error: # Like not being allowed to make threads there
+                log.warning("Couldn't make a thread for a tournament match in %s: %s", self.channel.id, error)
+        return self.channel.send
+
+    async def play_match(self, first: discord.Member, second: discord.Member):
+        # Play one game and return the winner, None for a draw, or UNPLAYED if it couldn't be played
+        try:
+            send = await self.destination(first, second)
+            view = await matchmaking.games[self.game](send, first, second)
+            await view.wait() # Some games are still going when they've been sent
+            # A game dropped from memory (see persistence.py) can carry on from its message, but not as part of the tournament
+            return UNPLAYED if view.evicted else view.winner
+        except Exception:
+            log.exception("Tournament match between %s and %s failed", first.id, second.id)
+            return UNPLAYED
+
+    async def knockout(self, first: discord.Member, second: discord.Member):
+        # A match someone has to win. Draws are played again, and if it keeps drawing the higher seed goes through.
+        # Returns (winner, whether it went to the higher seed), or (UNPLAYED, False) if it couldn't be played.
+        for _ in range(REPLAYS + 1):
+            winner = await self.play_match(first, second)
+            if winner is not None:
+                return winner, False
+        return first, True
+
+    def round_robin_rounds(self):
+        # The circle method: one player stays put and everyone else moves round one place each round
+        players = self.players + ([None] if len(self.players) % 2 else []) # Whoever's paired with None sits the round out
+        for _ in range(len(players) - 1):
+            half = len(players) // 2
+            yield [(a, b) for a, b in zip(players[:half], reversed(players[half:])) if a and b]
+            players = [players[0], players[-1], *players[1:-1]]
+
+    async def post(self, title: str, lines: list, color = discord.Color.blurple()):
+        # One message for the whole round
+        description = ""
+        for number, line in enumerate(lines):
+            if len(description) + len(line) > MAX_DESCRIPTION:
+                description += f"...and {len(lines) - number} more"
+                break
+            description += line + "\n"
+        await self.channel.send(embed = discord.Embed(title = title, description = description, color = color))
+
+    async def run(self):
+        if self.mode == ELIMINATION:
+            await self.run_elimination()
+        else:
+            await self.run_round_robin()
+
+    async def run_elimination(self):
+        remaining = self.players
+        lines = [f"{len(remaining)} players, single elimination. Each match is played in its own thread."]
+
+        while len(remaining) > 1:
+            self.round += 1
+            # The top seeds get byes until the field is a power of two, so after round 1 every round is even and nobody
+            # gets a second bye (unless a match couldn't be played, which knocks both players out)
+            byes = (1 << (len(remaining) - 1).bit_length()) - len(remaining)
+            bye, playing = remaining[:byes], remaining[byes:]
+            pairs = [(playing[i], playing[i + 1]) for i in range(0, len(playing), 2)]
+
+            lines += [f"**Round {self.round}**"] + [f"⚔️ {a.mention} vs {b.mention}" for a, b in pairs]
+            lines += [f"➡️ {player.mention} gets a bye" for player in bye]
+            await self.post(f"{self.name} tournament - Round {self.round}", lines)
+
+            results = await asyncio.gather(*(self.knockout(a, b) for a, b in pairs)) # Every match at once
+            lines = []
+            for (a, b), (winner, tiebreak) in zip(pairs, results):
+                if winner is UNPLAYED:
+                    lines.append(f"⚠️ {a.mention} vs {b.mention} couldn't be played, so neither of them goes through")
+                else:
+                    loser = b if winner == a else a
+                    lines.append(f"🏆 {winner.mention} beat {loser.mention}" + (" (on seeding, after draws)" if tiebreak else ""))
+
+            remaining = bye + [winner for winner, _ in results if winner is not UNPLAYED]
+
+        if not remaining:
+            lines.append("\nNobody's left, so there's no winner this time.")
+            await self.post(f"{self.name} tournament - Over", lines, discord.Color.red())
+            return
+
+        lines.append(f"\n👑 {remaining[0].mention} won the tournament!")
+        await self.post(f"{self.name} tournament - Winner", lines, discord.Color.gold())
+
+    async def run_round_robin(self):
+        lines = [f"{len(self.players)} players, round robin: everyone plays everyone once. Each match is played in its own thread."]
+
+        for pairs in self.round_robin_rounds():
+            self.round += 1
+            lines += [f"**Round {self.round}**"] + [f"⚔️ {a.mention} vs {b.mention}" for a, b in pairs]
+            await self.post(f"{self.name} tournament - Round {self.round}", lines)
+
+            results = await asyncio.gather(*(self.play_match(a, b) for a, b in pairs)) # Every match at once
+            lines = []
+            for (a, b), winner in zip(pairs, results):
+                if winner is UNPLAYED: # Nobody gets any points for it
+                    lines.append(f"⚠️ {a.mention} vs {b.mention} couldn't be played")
+                elif winner is None:
+                    self.points[a] += 0.5
+                    self.points[b] += 0.5
+                    lines.append(f"🤝 {a.mention} drew with {b.mention}")
+                else:
+                    self.points[winner] += 1
+                    lines.append(f"🏆 {winner.mention} beat {(b if winner == a else a).mention}")
+
+        standings = sorted(self.players, key = lambda player: self.points[player], reverse = True)
+        best = self.points[standings[0]]
+        winners = [player for player in standings if self.points[player] == best]
+        lines += ["\n**Standings**"] + [f"{place}. {player.mention} - {self.points[player]:g}" for place, player in enumerate(standings, start = 1)]
+        if best:
+            lines.append(f"\n👑 {' and '.join(winner.mention for winner in winners)} won the tournament!")
+        else: # None of the matches could be played
+            lines.append("\nNobody scored anything, so there's no winner this time.")
+        await self.post(f"{self.name} tournament - Results", lines, discord.Color.gold())